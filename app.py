@@ -1,9 +1,20 @@
+import collections
+import glob
 import json
+import math
+import os
 import subprocess
 import sys
+import threading
 import time
+import urllib.parse
 from pathlib import Path
-from extract_curl import process_extracted_curls, generate_requests_from_json
+from extract_curl import (
+    STORE_CATEGORIES, STORE_INDEX_FILE, generate_requests_from_json, load_store_index, process_extracted_curls,
+    read_store_records
+)
+from har_import import import_har
+import pandas as pd
 import streamlit as st
 
 
@@ -26,97 +37,223 @@ st.title("cURL Request Extractor")
 st.markdown("Paste one or more `curl` commands below:")
 
 user_input = st.text_area("Paste your cURL commands here", height=300)
+capture_file = st.file_uploader("...or upload a capture file with cURL commands", type=["txt", "sh", "bat", "cmd"])
 extracted_data_dir = "extracted_data"
 output_script_path = "../python_request.py"
 
 if st.button("Process cURL"):
-    if user_input.strip():
-        content = user_input.replace("\\\n", " ").replace("^\n", " ")
-        extracted_data = process_extracted_curls(content, extracted_data_dir)
-        st.session_state["extracted_data"] = extracted_data
+    if capture_file is not None or user_input.strip():
+        source = capture_file if capture_file is not None else user_input
+        process_extracted_curls(source, extracted_data_dir)
         st.session_state["curl_processed"] = True
         st.success("✅ cURL commands processed and saved.")
     else:
-        st.warning("⚠️ Please paste at least one cURL command.")
+        st.warning("⚠️ Please paste at least one cURL command or upload a capture file.")
+
+with st.expander("📦 Import a HAR export instead"):
+    har_file = st.file_uploader("Upload a browser HAR file", type=["har", "json"])
+    har_domains = st.text_input("Only these domains (comma separated, optional)", key="har_domains")
+    har_methods = st.multiselect("Only these methods (optional)", ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
+    har_mimes = st.text_input(
+        "Only these response MIME types (comma separated prefixes, optional)",
+        key="har_mimes",
+        help="e.g. `application/json, text/html`"
+    )
+    if st.button("Import HAR"):
+        if har_file is None:
+            st.warning("⚠️ Please upload a HAR file.")
+        else:
+            extracted_data = import_har(
+                har_file, extracted_data_dir,
+                domains=har_domains.split(","), methods=har_methods, mime_types=har_mimes.split(",")
+            )
+            st.session_state["curl_processed"] = True
+            st.success(f"✅ Imported {len(extracted_data['meta'])} requests from the HAR file.")
+
+METRICS_FILE = "run_metrics.json"
+METRICS_POLL_SECONDS = 1.0
+LOG_TAIL_LINES = 200
+
+
+def read_run_metrics(metrics_file):
+    # A single-process run writes metrics_file; worker processes write
+    # <stem>.<shard><ext> each.
+    stem, ext = os.path.splitext(metrics_file)
+    snapshots = []
+    for path in [metrics_file] + sorted(glob.glob(f"{stem}.*{ext}")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def render_run_metrics(container, snapshots):
+    if not snapshots:
+        container.info("⏳ Waiting for the first progress snapshot...")
+        return
+    totals = {key: sum(snapshot.get(key) or 0 for snapshot in snapshots)
+              for key in ("total", "completed", "failed", "errors")}
+    per_second = []
+    for snapshot in snapshots:
+        points = pd.DataFrame(snapshot.get("series") or [])
+        points = points.reindex(columns=["elapsed_s", "rps", "error_rate", "p50_ms", "p90_ms", "p99_ms", "concurrency"])
+        points["elapsed_s"] = points["elapsed_s"].round()
+        per_second.append(points.groupby("elapsed_s").agg({
+            "rps": "mean", "error_rate": "mean", "p50_ms": "max", "p90_ms": "max", "p99_ms": "max",
+            "concurrency": "mean"
+        }))
+    # Worker processes report separately: add their rates and limits, keep the worst percentiles.
+    chart = pd.concat(per_second).groupby(level=0).agg({
+        "rps": "sum", "error_rate": "mean", "p50_ms": "max", "p90_ms": "max", "p99_ms": "max",
+        "concurrency": lambda values: values.sum(min_count=1)
+    })
+    latest = chart.iloc[-1] if len(chart) else pd.Series(dtype=float)
+
+    with container.container():
+        cols = st.columns(4)
+        cols[0].metric("Completed", f"{totals['completed']}/{totals['total']}")
+        cols[1].metric("Requests/s", f"{latest.get('rps', 0):.1f}")
+        bad = totals["failed"] + totals["errors"]
+        cols[2].metric("Error rate", f"{bad / totals['completed']:.1%}" if totals["completed"] else "0.0%")
+        cols[3].metric("p99 latency", f"{latest.get('p99_ms', 0):.1f} ms" if pd.notna(latest.get("p99_ms")) else "-")
+        if totals["total"]:
+            st.progress(min(totals["completed"] / totals["total"], 1.0))
+        if len(chart):
+            chart_cols = st.columns(2)
+            chart_cols[0].line_chart(chart[["rps"]])
+            chart_cols[1].line_chart(chart[["p50_ms", "p90_ms", "p99_ms"]])
+            if chart["concurrency"].notna().any():
+                st.line_chart(chart[["concurrency"]])
+
+
+SELECTION_COLUMNS = ["include", "cookies", "proxy", "curl_cffi", "search"]
+
+
+def store_version(extracted_data_dir):
+    index_path = os.path.join(extracted_data_dir, STORE_INDEX_FILE)
+    return os.path.getmtime(index_path) if os.path.exists(index_path) else 0
+
+
+@st.cache_data(show_spinner=False)
+def load_requests(extracted_data_dir, version):
+    # Keyed on the index mtime, so reruns reuse the table until a new extraction.
+    store_index = load_store_index(extracted_data_dir)
+    table = pd.DataFrame(store_index["meta"], columns=["method", "url"])
+    table.insert(0, "#", range(1, len(table) + 1))
+    table["domain"] = [urllib.parse.urlparse(url or "").netloc for url in table["url"]]
+    return store_index, table
+
+
+@st.cache_data(show_spinner=False)
+def load_preview(extracted_data_dir, version, count=3):
+    store_index = load_store_index(extracted_data_dir)
+    return list(read_store_records(extracted_data_dir, range(min(count, len(store_index["meta"]))), store_index))
+
 
 if st.session_state.get("curl_processed"):
-    extracted_data = st.session_state.get("extracted_data", {})
+    version = store_version(extracted_data_dir)
+    store_index, request_table = load_requests(extracted_data_dir, version)
+    meta_list = store_index["meta"]
 
     st.sidebar.header("🔍 View Extracted Category")
-    selected_key = st.sidebar.selectbox("Select a category:", list(extracted_data.keys()))
+    selected_key = st.sidebar.selectbox("Select a category:", STORE_CATEGORIES + ["meta"])
     st.sidebar.markdown(f"### `{selected_key}` Preview")
 
-    if extracted_data[selected_key]:
-        for i, item in enumerate(extracted_data[selected_key]):
-            st.sidebar.json(item)
-            if i >= 2:
-                break
+    if meta_list:
+        for i, record in enumerate(load_preview(extracted_data_dir, version)):
+            st.sidebar.json(meta_list[i] if selected_key == "meta" else record[selected_key])
     else:
         st.sidebar.write("No data in this category.")
 
     st.title("🛠️ Generate Python Request")
 
-    def load_json(filepath):
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return []
-
-    headers_list = load_json(f"{extracted_data_dir}/headers.json")
-    cookies_list = load_json(f"{extracted_data_dir}/cookies.json")
-    query_params_list = load_json(f"{extracted_data_dir}/query_params.json")
-    body_params_list = load_json(f"{extracted_data_dir}/body_params.json")
-    form_data_list = load_json(f"{extracted_data_dir}/form_data.json")
-    json_data_list = load_json(f"{extracted_data_dir}/json_data.json")
-    meta_list = load_json(f"{extracted_data_dir}/meta.json")
-
     if not meta_list:
         st.warning("⚠️ No requests found.")
         st.stop()
 
-    st.markdown(f"**Total Requests Found:** {len(meta_list)}")
-
-    include_requests = []
-    use_cookies_list = []
-    use_proxy_list = []
-    use_curl_cffi_list = []
+    # Per-request options live in one DataFrame for the session, reset whenever
+    # a new extraction replaces the store.
+    if st.session_state.get("selection_version") != version:
+        st.session_state["selection"] = pd.DataFrame(
+            {"include": False, "cookies": False, "proxy": False, "curl_cffi": False, "search": ""},
+            index=request_table.index
+        )
+        st.session_state["selection_version"] = version
+        st.session_state["editor_epoch"] = 0
+    selection = st.session_state["selection"]
+
+    filter_cols = st.columns([2, 2, 3])
+    domain_filter = filter_cols[0].multiselect("🌍 Domain", sorted(request_table["domain"].unique()))
+    method_filter = filter_cols[1].multiselect("🔤 Method", sorted(request_table["method"].unique()))
+    url_filter = filter_cols[2].text_input("🔎 URL contains")
+
+    mask = pd.Series(True, index=request_table.index)
+    if domain_filter:
+        mask &= request_table["domain"].isin(domain_filter)
+    if method_filter:
+        mask &= request_table["method"].isin(method_filter)
+    if url_filter:
+        mask &= request_table["url"].str.contains(url_filter, case=False, regex=False, na=False)
+    filtered_ids = request_table.index[mask]
+
+    bulk_cols = st.columns(4)
+    bulk_actions = [
+        (bulk_cols[0], f"✅ Include {len(filtered_ids)} filtered", "include", True),
+        (bulk_cols[1], "🚫 Exclude filtered", "include", False),
+        (bulk_cols[2], "🍪 Cookies on filtered", "cookies", True),
+        (bulk_cols[3], "⚡ curl_cffi on filtered", "curl_cffi", True),
+    ]
+    for column, label, field, value in bulk_actions:
+        if column.button(label):
+            selection.loc[filtered_ids, field] = value
+            # A fresh editor key drops edits that would overwrite the bulk change.
+            st.session_state["editor_epoch"] += 1
+
+    page_cols = st.columns([1, 1, 4])
+    page_size = page_cols[0].selectbox("Rows per page", [25, 50, 100, 250], index=1)
+    page_count = max(1, math.ceil(len(filtered_ids) / page_size))
+    page = int(page_cols[1].number_input("Page", min_value=1, max_value=page_count, value=1))
+    page_ids = filtered_ids[(page - 1) * page_size:page * page_size]
+
+    editor_key = hash((st.session_state["editor_epoch"], page, page_size, tuple(domain_filter),
+                       tuple(method_filter), url_filter))
+    edited = st.data_editor(
+        request_table.loc[page_ids, ["#", "method", "url"]].join(selection.loc[page_ids]),
+        key=f"request_editor_{editor_key}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=["#", "method", "url"],
+        column_config={
+            "include": st.column_config.CheckboxColumn("✅ Include"),
+            "cookies": st.column_config.CheckboxColumn("🍪 Cookies"),
+            "proxy": st.column_config.CheckboxColumn("🛡️ Proxy"),
+            "curl_cffi": st.column_config.CheckboxColumn("⚡ curl_cffi"),
+            "search": st.column_config.TextColumn(
+                "🔍 Search text",
+                help="Separate several patterns with `||`; the response matches if any of them is found."
+            ),
+        },
+    )
+    for column in SELECTION_COLUMNS:
+        selection.loc[page_ids, column] = edited[column]
+
+    st.markdown(
+        f"**Total Requests Found:** {len(request_table)} · **Showing:** {len(filtered_ids)} "
+        f"· **Included:** {int(selection['include'].sum())}"
+    )
+
+    include_requests = selection["include"].tolist()
+    use_cookies_list = (selection["include"] & selection["cookies"]).tolist()
+    use_proxy_list = (selection["include"] & selection["proxy"]).tolist()
+    use_curl_cffi_list = (selection["include"] & selection["curl_cffi"]).tolist()
     search_texts = []
-
-    def handle_include_change(idx):
-        if st.session_state.get(f"include_{idx}", False):
-            st.session_state[f"expander_{idx}"] = True
-
-    for idx, meta in enumerate(meta_list):
-        include_key = f"include_{idx}"
-        expander_key = f"expander_{idx}"
-        st.session_state.setdefault(expander_key, False)
-        st.session_state.setdefault(include_key, False)
-
-        with st.expander(f"Request #{idx + 1}: {meta['method']} {meta['url']}", expanded=st.session_state[expander_key]):
-            st.checkbox(
-                "✅ Include this request?",
-                key=include_key,
-                on_change=handle_include_change,
-                args=(idx,)
-            )
-
-            include = st.session_state[include_key]
-            include_requests.append(include)
-
-            if include:
-                cookies = st.checkbox("🍪 Use cookies?", key=f"cookies_{idx}")
-                proxy = st.checkbox("🛡️ Use proxy?", key=f"proxy_{idx}")
-                cffi = st.checkbox("⚡ Use curl_cffi (if no request)?", key=f"cffi_{idx}")
-                search = st.text_input("🔍 Text to search in response (optional):", key=f"search_{idx}")
-            else:
-                cookies = proxy = cffi = False
-                search = ""
-
-            use_cookies_list.append(cookies)
-            use_proxy_list.append(proxy)
-            use_curl_cffi_list.append(cffi)
-            search_texts.append(search)
+    for include, search in zip(include_requests, selection["search"]):
+        search = (search or "") if include else ""
+        if "||" in search:
+            search = [text.strip() for text in search.split("||") if text.strip()]
+        search_texts.append(search)
 
     proxy_url = ""
     if any(use_proxy_list):
@@ -134,22 +271,175 @@ if st.session_state.get("curl_processed"):
 
     st.subheader("🥪 Execution Settings")
     total_runs = st.number_input("🔁 Number of times to run all requests", min_value=1, value=1)
-    threads = st.number_input("🔧 Number of threads to use", min_value=1, value=1)
+    engine = st.selectbox(
+        "⚙️ Execution engine",
+        ["threads", "async"],
+        help="`async` runs every request through a curl_cffi AsyncSession and treats the number below as the "
+             "number of in-flight requests."
+    )
+    if engine == "async":
+        threads = st.number_input("🔧 Number of concurrent requests", min_value=1, value=100)
+    else:
+        threads = st.number_input("🔧 Number of threads to use", min_value=1, value=1)
+    load_mode = st.selectbox(
+        "📈 Load model",
+        ["closed", "open"],
+        help="`closed` sends the next request as soon as a worker is free. `open` sends at a target rate "
+             "and measures latency from each request's intended send time."
+    )
+    target_rps = 10.0
+    rate_profile = "constant"
+    profile_seconds = 60.0
+    if load_mode == "open":
+        target_rps = st.number_input("🎯 Target requests per second", min_value=0.1, value=10.0)
+        rate_profile = st.selectbox("📐 Rate profile", ["constant", "ramp", "step", "spike"])
+        if rate_profile != "constant":
+            profile_seconds = st.number_input(
+                "⏱️ Profile period in seconds",
+                min_value=1.0,
+                value=60.0,
+                help="Ramp duration, length of each of the 4 steps, or the spike cycle (5x rate for its last 10%)."
+            )
+    adaptive_concurrency = False
+    if load_mode == "closed":
+        adaptive_concurrency = st.checkbox(
+            "🎚️ Adaptive concurrency (AIMD)",
+            help="Grows in-flight requests while latency holds steady and halves them on errors, 429/5xx or "
+                 "latency spikes. The number above becomes the upper bound."
+        )
+    retry_cols = st.columns(4)
+    max_retries = retry_cols[0].number_input("🔄 Retries per request", min_value=0, value=0)
+    retry_backoff = retry_cols[1].number_input(
+        "⏳ Backoff base (s)", min_value=0.0, value=0.5, disabled=not max_retries,
+        help="Full-jitter exponential backoff: a random wait up to base × 2^attempt."
+    )
+    breaker_threshold = retry_cols[2].number_input(
+        "🔌 Circuit breaker after N failures", min_value=0, value=0,
+        help="Consecutive failures (errors, 429 or 5xx) of one request that stop sending it for the cooldown. 0 disables."
+    )
+    breaker_cooldown = retry_cols[3].number_input(
+        "🧊 Breaker cooldown (s)", min_value=1.0, value=30.0, disabled=not breaker_threshold
+    )
+    processes = st.number_input(
+        "🧩 Number of worker processes",
+        min_value=1,
+        value=1,
+        help="Splits the runs across processes so a single run can use every CPU core."
+    )
+    distributed = st.checkbox(
+        "🛰️ Coordinator/worker mode",
+        help="The script can hand its work out in leases to worker copies of itself, on this machine or on "
+             "others, and merges their per-second counts and latency histograms into one report."
+    )
+    local_workers = 2
+    if distributed:
+        local_workers = st.number_input("🖥️ Local workers for Run now", min_value=1, value=2)
+        st.caption("On other hosts run `python generated_script.py --worker http://<coordinator>:<port>` against "
+                   "`python generated_script.py --coordinator 0.0.0.0:<port> --workers <N>`.")
+    cassette = st.checkbox(
+        "🎞️ Record/replay and profiling options",
+        help="Adds `--record FILE`, `--replay FILE` and `--profile cprofile|pyinstrument` to the script. Replaying "
+             "a recorded run answers every request from memory, which shows the runner's own maximum throughput "
+             "and where it spends CPU."
+    )
+    setup_request = None
+    setup_extract = {}
+    setup_ttl = 300.0
+    if st.checkbox(
+        "🔑 Run one request as a session setup (e.g. login)?",
+        help="The setup request runs once per worker process instead of with every iteration. Its response "
+             "cookies are sent with all other requests, and extracted values fill `{{name}}` placeholders in "
+             "their URL, query, headers, cookies and body. It runs again after the TTL or when a request gets a 401."
+    ):
+        setup_request = st.selectbox(
+            "🔐 Setup request",
+            range(len(request_table)),
+            format_func=lambda idx: f"#{idx + 1} {request_table['method'][idx]} {request_table['url'][idx]}"
+        )
+        setup_rules = st.text_area(
+            "🧲 Values to extract, one `name = rule` per line",
+            placeholder="token = json:data.access_token\ncsrf = css:input[name=csrf]::attr(value)",
+            help="Rules: `json:` (JMESPath), `css:`, `xpath:`, `regex:` (first group), `cookie:` or `header:`."
+        )
+        setup_ttl = st.number_input("⏳ Refresh the session after (s, 0 = only on 401)", min_value=0.0, value=300.0)
+        for line in setup_rules.splitlines():
+            if "=" in line:
+                name, rule = line.split("=", 1)
+                setup_extract[name.strip()] = rule.strip()
+        # The setup request keeps its own row settings even when it is not part of the load.
+        use_cookies_list[setup_request] = bool(selection["cookies"][setup_request])
+        use_proxy_list[setup_request] = bool(selection["proxy"][setup_request] and proxy_url)
+        use_curl_cffi_list[setup_request] = bool(selection["curl_cffi"][setup_request])
+    results_storage = st.selectbox(
+        "🗄️ Results storage",
+        ["in memory", "parquet", "csv", "jsonl"],
+        help="File formats stream results to disk in batches, so memory stays flat for long runs."
+    )
+    results_format = None if results_storage == "in memory" else results_storage
+    render_excel = True
+    if results_format:
+        render_excel = st.checkbox("📊 Render Excel report at the end?", value=True)
+    stream_search = st.checkbox(
+        "🌊 Stream response bodies while searching?",
+        help="Searches raw bytes chunk by chunk instead of decoding the whole body first."
+    )
+    close_on_match = True
+    search_byte_limit = 0
+    if stream_search:
+        close_on_match = st.checkbox(
+            "✂️ Stop reading as soon as the text is found?",
+            value=True,
+            help="Saved pages then only contain the body up to the match."
+        )
+        search_byte_limit = st.number_input(
+            "📏 Give up searching after this many bytes (0 = whole body)", min_value=0, value=0
+        )
+    phase_timings = st.checkbox(
+        "⏲️ Record DNS / connect / TLS / TTFB / transfer timings?",
+        help="Full breakdown needs curl_cffi; with requests only TTFB and transfer are available. "
+             "Turns on connection reuse in the threads engine."
+    )
+    script_layout = st.selectbox(
+        "🗂️ Script layout",
+        ["functions", "table", "table (sidecar file)"],
+        help="`functions` writes one small function per request. `table` keeps every request as data for a "
+             "single executor, which stays compact and fast to import with thousands of requests."
+    )
+    prepare_requests = st.checkbox(
+        "🧱 Prepare each request once and reuse it?",
+        help="Encodes URL, query string, cookies and body once at startup instead of on every call. "
+             "Turns on connection reuse in the threads engine."
+    )
+    background_saves = st.checkbox(
+        "💾 Save matched responses in the background?",
+        help="Writes raw response bytes from a writer thread, named by content hash so identical bodies are "
+             "stored once."
+    )
+    save_compression = None
+    if background_saves:
+        compression = st.selectbox("🗜️ Compress saved responses", ["none", "gzip", "zstd"])
+        save_compression = None if compression == "none" else compression
+        if save_compression == "zstd":
+            st.caption("zstd needs the `zstandard` package in the environment that runs the script.")
+    use_sessions = False
+    pool_size = 10
+    keep_alive = True
+    if engine == "threads":
+        use_sessions = st.checkbox(
+            "♻️ Reuse connections (one session per thread)?", value=phase_timings or prepare_requests
+        )
+    if use_sessions:
+        pool_size = st.number_input("🔗 Connection pool size per session", min_value=1, value=10)
+        keep_alive = st.checkbox("💓 Keep connections alive?", value=True)
 
     # 🔐 Disable button if script has run
     if st.button("🚀 Generate Python Script", disabled=st.session_state["script_ran"]):
-        if not any(include_requests):
+        if not any(include for idx, include in enumerate(include_requests) if idx != setup_request):
             st.warning("⚠️ You must include at least one request.")
             st.stop()
         try:
             generate_requests_from_json(
-                headers_file=f"{extracted_data_dir}/headers.json",
-                cookies_file=f"{extracted_data_dir}/cookies.json",
-                query_params_file=f"{extracted_data_dir}/query_params.json",
-                body_params_file=f"{extracted_data_dir}/body_params.json",
-                form_data_file=f"{extracted_data_dir}/form_data.json",
-                json_data_file=f"{extracted_data_dir}/json_data.json",
-                meta_file=f"{extracted_data_dir}/meta.json",
+                extracted_data_dir=extracted_data_dir,
                 output_file=output_script_path,
                 include_requests=include_requests,
                 use_cookies_list=use_cookies_list,
@@ -159,7 +449,39 @@ if st.session_state.get("curl_processed"):
                 total_runs=total_runs,
                 threads=threads,
                 report_filename="report.xlsx",
-                proxy_url=proxy_url
+                proxy_url=proxy_url,
+                use_sessions=use_sessions,
+                pool_size=pool_size,
+                keep_alive=keep_alive,
+                engine=engine,
+                processes=processes,
+                results_format=results_format,
+                render_excel=render_excel,
+                stream_search=stream_search,
+                close_on_match=close_on_match,
+                search_byte_limit=search_byte_limit,
+                load_mode=load_mode,
+                target_rps=target_rps,
+                rate_profile=rate_profile,
+                profile_seconds=profile_seconds,
+                phase_timings=phase_timings,
+                script_layout="functions" if script_layout == "functions" else "table",
+                spec_storage="sidecar" if script_layout == "table (sidecar file)" else "embedded",
+                prepare_requests=prepare_requests,
+                background_saves=background_saves,
+                save_compression=save_compression,
+                metrics_file=METRICS_FILE,
+                metrics_interval=METRICS_POLL_SECONDS,
+                adaptive_concurrency=adaptive_concurrency,
+                max_retries=max_retries,
+                retry_backoff=retry_backoff,
+                breaker_threshold=breaker_threshold,
+                breaker_cooldown=breaker_cooldown,
+                distributed=distributed,
+                cassette=cassette,
+                setup_request=setup_request,
+                setup_extract=setup_extract,
+                setup_ttl=setup_ttl
             )
 
             st.success(f"✅ Script generated: `{output_script_path}`")
@@ -171,6 +493,9 @@ if st.session_state.get("curl_processed"):
             st.download_button("📅 Download Script", code, file_name="generated_script.py", mime="text/x-python")
 
             st.session_state["script_generated"] = True
+            st.session_state["results_file"] = f"report.{results_format}" if results_format else ""
+            st.session_state["run_args"] = ["--coordinator", "127.0.0.1:0", "--spawn-local", str(local_workers)] \
+                if distributed else []
 
         except Exception as e:
             st.error(f"❌ Error: {e}")
@@ -192,24 +517,50 @@ if st.session_state.get("script_generated"):
                 python_exec = sys.executable
                 start_time = time.time()
 
-                st.write("### 📤 Output:")
+                for stale in glob.glob(f"{os.path.splitext(METRICS_FILE)[0]}*.json"):
+                    os.remove(stale)
+
+                st.write("### 📊 Progress:")
+                metrics_container = st.empty()
+                st.write("### 📤 Output (latest lines):")
                 output_container = st.empty()
 
                 process = subprocess.Popen(
-                    [python_exec, "-u", output_script_path],
+                    [python_exec, "-u", output_script_path, *st.session_state.get("run_args", [])],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
                     universal_newlines=True,
                     bufsize=1
                 )
 
-                live_output = ""
-                for line in process.stdout:
-                    live_output += line
-                    output_container.code(live_output, language="bash")
+                # stdout is drained by a thread into a bounded tail; the page is
+                # redrawn on a fixed interval from the metrics snapshot instead
+                # of once per output line.
+                log_tail = collections.deque(maxlen=LOG_TAIL_LINES)
+                log_lock = threading.Lock()
+
+                def pump_output():
+                    for line in process.stdout:
+                        with log_lock:
+                            log_tail.append(line.rstrip("\n"))
+
+                reader = threading.Thread(target=pump_output, daemon=True)
+                reader.start()
+
+                def refresh_output():
+                    render_run_metrics(metrics_container, read_run_metrics(METRICS_FILE))
+                    with log_lock:
+                        lines = list(log_tail)
+                    output_container.code("\n".join(lines), language="bash")
+
+                while process.poll() is None:
+                    time.sleep(METRICS_POLL_SECONDS)
+                    refresh_output()
 
+                reader.join()
                 process.stdout.close()
                 return_code = process.wait()
+                refresh_output()
                 elapsed = round(time.time() - start_time, 2)
 
                 if return_code == 0:
@@ -226,7 +577,11 @@ if st.session_state.get("script_generated"):
                         file_name="report.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
-            else:
+            results_file = st.session_state.get("results_file")
+            if results_file and Path(results_file).exists():
+                with open(results_file, "rb") as f:
+                    st.download_button("📅 Download Raw Results", f, file_name=results_file)
+            elif not report_path.exists():
                 st.warning("⚠️ Report file not found.")
 
             # ✅ Trigger button re-enable
@@ -0,0 +1,310 @@
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from extract_curl import generate_requests_from_json, load_store_index, process_extracted_curls
+
+
+BENCHMARK_FILE = "benchmark_results.json"
+BENCHMARK_SEED = 1234
+PARSE_SIZES = [1000, 10000, 100000]
+CODEGEN_SIZES = [100, 1000, 5000]
+CODEGEN_LAYOUTS = ["functions", "table"]
+E2E_ENGINES = ["threads", "async"]
+E2E_PATHS = ["/items", "/search", "/upload"]
+
+
+def synthetic_curl(rng, idx):
+    # A mix of what browser "copy as cURL" produces: GETs with query strings,
+    # cookie-laden requests, JSON and form POSTs, multi-line continuations.
+    host = f"api{idx % 7}.example.com"
+    headers = [
+        "-H 'accept: application/json'",
+        f"-H 'user-agent: Mozilla/5.0 (X11; Linux x86_64) bench/{idx % 13}'",
+        f"-H 'x-request-id: {rng.getrandbits(64):016x}'",
+    ]
+    kind = idx % 4
+    if kind == 0:
+        return f"curl 'https://{host}/items?page={idx}&sort=desc&q=term{idx % 97}' " + " ".join(headers)
+    if kind == 1:
+        cookies = "; ".join(f"c{n}={rng.getrandbits(32):08x}" for n in range(6))
+        return f"curl 'https://{host}/account' -b '{cookies}' " + " \\\n  ".join(headers)
+    if kind == 2:
+        body = json.dumps({"id": idx, "tags": [f"t{n}" for n in range(idx % 5)], "note": "it's \"quoted\""})
+        body = body.replace("'", "'\\''")
+        return (f"curl 'https://{host}/search' -H 'content-type: application/json' " + " ".join(headers) +
+                f" --data-raw '{body}'")
+    return (f"curl -X POST \"https://{host}/form\" -H \"content-type: application/x-www-form-urlencoded\" "
+            f"--data-urlencode \"name=user {idx}\" -d \"page={idx}&flag=true\" --compressed")
+
+
+def synthetic_capture(count, seed=BENCHMARK_SEED):
+    rng = random.Random(seed)
+    return "\n".join(synthetic_curl(rng, idx) for idx in range(count)) + "\n"
+
+
+def bench_parse(sizes, work_dir):
+    rows = []
+    for count in sizes:
+        capture = synthetic_capture(count)
+        store_dir = os.path.join(work_dir, f"parse_{count}")
+        # Without the parse cache, filling an empty cache, and fully cached.
+        for mode, cache_size in (("uncached", 0), ("cache_fill", count), ("cached", count)):
+            if mode != "cached":
+                shutil.rmtree(store_dir, ignore_errors=True)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                index = process_extracted_curls(capture, store_dir, cache_size=cache_size)
+                seconds = time.perf_counter() - started
+            rows.append({
+                "commands": count, "mode": mode, "parsed": len(index["meta"]), "seconds": seconds,
+                "commands_per_s": count / seconds, "mb_per_s": len(capture.encode("utf-8")) / seconds / 1e6,
+            })
+            print(f"🧮 parse {count:>7} {mode:<10} {count / seconds:>10.0f} commands/s")
+    return rows
+
+
+def bench_codegen(sizes, layouts, work_dir):
+    rows = []
+    for count in sizes:
+        store_dir = os.path.join(work_dir, f"codegen_{count}")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            process_extracted_curls(synthetic_capture(count), store_dir, cache_size=0)
+        total = len(load_store_index(store_dir)["meta"])
+        for layout in layouts:
+            output_file = os.path.join(work_dir, f"codegen_{count}_{layout}.py")
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                generate_requests_from_json(
+                    store_dir, output_file, [True] * total, [True] * total, [False] * total, [False] * total,
+                    [""] * total, response_dir=os.path.join(work_dir, "saved_pages"), script_layout=layout
+                )
+                seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"import runpy; runpy.run_path({output_file!r})"], check=True,
+                           stdout=subprocess.DEVNULL)
+            import_seconds = time.perf_counter() - started
+            rows.append({
+                "requests": total, "layout": layout, "seconds": seconds, "bytes": os.path.getsize(output_file),
+                "import_seconds": import_seconds,
+            })
+            print(f"🏗️ codegen {total:>6} {layout:<10} {seconds * 1000:>8.1f}ms "
+                  f"{os.path.getsize(output_file) / 1024:>8.1f}KB, import {import_seconds * 1000:.0f}ms")
+    return rows
+
+
+async def stand_in_handler(reader, writer, latency, body):
+    # Minimal HTTP/1.1 keep-alive server: reads the request and its body,
+    # waits the configured latency and answers with a fixed-size body.
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            close = False
+            for line in head.split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    length = int(value.strip())
+                elif name == b"connection" and value.strip().lower() == b"close":
+                    close = True
+            if length:
+                await reader.readexactly(length)
+            if latency:
+                await asyncio.sleep(latency)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: " +
+                         str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+            if close:
+                break
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def start_stand_in_server(latency_ms, body_size):
+    body = b"x" * body_size
+    ready = threading.Event()
+    state = {}
+
+    async def serve():
+        server = await asyncio.start_server(
+            lambda r, w: stand_in_handler(r, w, latency_ms / 1000, body), "127.0.0.1", 0, backlog=1024
+        )
+        state["port"] = server.sockets[0].getsockname()[1]
+        state["loop"] = asyncio.get_running_loop()
+        state["stop"] = asyncio.Event()
+        ready.set()
+        async with server:
+            await state["stop"].wait()
+
+    thread = threading.Thread(target=lambda: asyncio.run(serve()), name="stand-in-server", daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop():
+        state["loop"].call_soon_threadsafe(state["stop"].set)
+        thread.join()
+
+    return state["port"], stop
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def bench_end_to_end(engines, total_requests, threads, latency_ms, body_size, work_dir):
+    port, stop = start_stand_in_server(latency_ms, body_size)
+    rows = []
+    try:
+        base = f"http://127.0.0.1:{port}"
+        capture = "\n".join([
+            f"curl '{base}{E2E_PATHS[0]}?page=1' -H 'accept: application/json'",
+            f"curl '{base}{E2E_PATHS[1]}' -H 'content-type: application/json' --data-raw '{{\"q\": \"term\"}}'",
+            f"curl '{base}{E2E_PATHS[2]}' -d 'name=bench&size={body_size}'",
+        ])
+        store_dir = os.path.join(work_dir, "e2e_store")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            process_extracted_curls(capture, store_dir, cache_size=0)
+        count = len(E2E_PATHS)
+        total_runs = max(total_requests // count, 1)
+        for engine in engines:
+            run_dir = os.path.join(work_dir, f"e2e_{engine}")
+            os.makedirs(run_dir, exist_ok=True)
+            script = os.path.join(run_dir, "bench_script.py")
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                generate_requests_from_json(
+                    store_dir, script, [True] * count, [False] * count, [False] * count, [False] * count,
+                    [""] * count, total_runs=total_runs, threads=threads,
+                    report_filename="report.xlsx", response_dir=os.path.join(run_dir, "saved_pages"),
+                    engine=engine, results_format="jsonl", render_excel=False, use_sessions=True,
+                    metrics_file="metrics.json"
+                )
+            started = time.perf_counter()
+            subprocess.run([sys.executable, script], cwd=run_dir, check=True, stdout=subprocess.DEVNULL)
+            seconds = time.perf_counter() - started
+            # The final metrics snapshot times the run itself, without interpreter startup and imports.
+            with open(os.path.join(run_dir, "metrics.json"), encoding="utf-8") as f:
+                run_seconds = json.load(f)["elapsed_s"]
+            latencies = []
+            statuses = {}
+            with open(os.path.join(run_dir, "report.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    statuses[str(row["status_code"])] = statuses.get(str(row["status_code"]), 0) + 1
+                    if row["latency_ms"] is not None:
+                        latencies.append(row["latency_ms"])
+            rows.append({
+                "engine": engine, "requests": len(latencies), "threads": threads, "latency_ms": latency_ms,
+                "body_size": body_size, "seconds": seconds, "run_seconds": run_seconds,
+                "rps": len(latencies) / run_seconds,
+                "p50_ms": percentile(latencies, 0.5), "p90_ms": percentile(latencies, 0.9),
+                "p99_ms": percentile(latencies, 0.99), "statuses": statuses,
+            })
+            print(f"🚀 e2e {engine:<8} {len(latencies) / run_seconds:>8.0f} req/s "
+                  f"p50={percentile(latencies, 0.5):.1f}ms p99={percentile(latencies, 0.99):.1f}ms")
+    finally:
+        stop()
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Higher is better for throughput metrics, lower for times, sizes and latencies.
+COMPARED_METRICS = {
+    "parse": (("commands", "mode"), {"commands_per_s": 1}),
+    "codegen": (("requests", "layout"), {"seconds": -1, "bytes": -1, "import_seconds": -1}),
+    "end_to_end": (("engine",), {"rps": 1, "p50_ms": -1, "p99_ms": -1}),
+}
+
+
+def compare_results(baseline, current):
+    print(f"📏 Compared with {baseline.get('revision') or 'baseline'} ({baseline.get('timestamp')})")
+    for section, (keys, metrics) in COMPARED_METRICS.items():
+        before = {tuple(row[key] for key in keys): row for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            old = before.get(tuple(row[key] for key in keys))
+            if old is None:
+                continue
+            for metric, direction in metrics.items():
+                if not old.get(metric) or row.get(metric) is None:
+                    continue
+                change = (row[metric] - old[metric]) / old[metric] * 100
+                marker = "✅" if change * direction >= 0 else "⚠️"
+                label = " ".join(str(row[key]) for key in keys)
+                print(f"{marker} {section} {label} {metric}: {old[metric]:.4g} -> {row[metric]:.4g} ({change:+.1f}%)")
+
+
+def run_benchmarks(output_file=BENCHMARK_FILE, parse_sizes=PARSE_SIZES, codegen_sizes=CODEGEN_SIZES,
+                   codegen_layouts=CODEGEN_LAYOUTS, engines=E2E_ENGINES, total_requests=3000, threads=16,
+                   latency_ms=5.0, body_size=4096, baseline_file=None):
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    work_dir = tempfile.mkdtemp(prefix="curl_bench_")
+    try:
+        if parse_sizes:
+            results["parse"] = bench_parse(parse_sizes, work_dir)
+        if codegen_sizes:
+            results["codegen"] = bench_codegen(codegen_sizes, codegen_layouts, work_dir)
+        if engines:
+            results["end_to_end"] = bench_end_to_end(engines, total_requests, threads, latency_ms, body_size, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Benchmark results saved to {output_file}")
+    if baseline_file:
+        with open(baseline_file, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), results)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def int_list(value):
+        return [int(item) for item in value.split(",") if item.strip()]
+
+    def name_list(value):
+        return [item.strip() for item in value.split(",") if item.strip()]
+
+    parser = argparse.ArgumentParser(description="Benchmark parsing, code generation and generated runners.")
+    parser.add_argument("--out", default=BENCHMARK_FILE, help="JSON file for the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to compare against")
+    parser.add_argument("--parse-sizes", type=int_list, default=PARSE_SIZES, help="comma separated, empty to skip")
+    parser.add_argument("--codegen-sizes", type=int_list, default=CODEGEN_SIZES, help="comma separated, empty to skip")
+    parser.add_argument("--layouts", type=name_list, default=CODEGEN_LAYOUTS, help="script layouts for codegen")
+    parser.add_argument("--engines", type=name_list, default=E2E_ENGINES, help="runner engines, empty to skip")
+    parser.add_argument("--requests", type=int, default=3000, help="requests per end-to-end run")
+    parser.add_argument("--threads", type=int, default=16, help="threads / in-flight requests per run")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="stand-in server response delay")
+    parser.add_argument("--body-size", type=int, default=4096, help="stand-in server response body bytes")
+    args = parser.parse_args()
+    run_benchmarks(args.out, args.parse_sizes, args.codegen_sizes, args.layouts, args.engines, args.requests,
+                   args.threads, args.latency_ms, args.body_size, args.compare)
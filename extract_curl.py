@@ -1,75 +1,2019 @@
+import base64
+import codecs
 import glob
+import hashlib
 import os
 import re
+import sqlite3
+import time
 import urllib.parse
-from datetime import datetime
 import textwrap
-import shlex
-import urllib.parse
 import json
 
 
-def extract_curl(curl_command):
-    tokens = shlex.split(curl_command)
+RESULT_FIELDS = [
+    ("url", "string"),
+    ("request", "string"),
+    ("status_code", "int64"),
+    ("status", "string"),
+    ("time_taken", "float64"),
+    ("latency_ms", "float64"),
+    ("queue_ms", "float64"),
+    ("text_matched", "string"),
+]
+
+PHASE_FIELDS = [
+    ("dns_ms", "float64"),
+    ("connect_ms", "float64"),
+    ("tls_ms", "float64"),
+    ("ttfb_ms", "float64"),
+    ("transfer_ms", "float64"),
+]
+
+# Per-phase timings. curl_cffi sessions copy libcurl's cumulative timers into
+# response.infos, which are split into additive phases here. requests only
+# knows when the response headers arrived, so there ttfb_ms also covers
+# connection setup and the dns/connect/tls columns stay empty.
+PHASE_TIMINGS_BLOCK = """
+from curl_cffi import CurlInfo
+
+PHASE_INFOS = [
+    CurlInfo.NAMELOOKUP_TIME, CurlInfo.CONNECT_TIME, CurlInfo.APPCONNECT_TIME,
+    CurlInfo.PRETRANSFER_TIME, CurlInfo.STARTTRANSFER_TIME, CurlInfo.TOTAL_TIME,
+]
+
+
+def phase_timings(response, total):
+    infos = getattr(response, "infos", None)
+    if infos:
+        namelookup, connect, appconnect, pretransfer, starttransfer, curl_total = (
+            infos.get(i, 0.0) for i in PHASE_INFOS
+        )
+        if curl_total > starttransfer:
+            # libcurl's total excludes Python overhead; streamed bodies are
+            # still being read when the timers are copied, so keep wall time.
+            total = curl_total
+        return {
+            "dns_ms": namelookup * 1000,
+            "connect_ms": max(connect - namelookup, 0.0) * 1000,
+            "tls_ms": max(appconnect - connect, 0.0) * 1000 if appconnect else 0.0,
+            "ttfb_ms": max(starttransfer - max(pretransfer, appconnect, connect), 0.0) * 1000,
+            "transfer_ms": max(total - starttransfer, 0.0) * 1000,
+        }
+    ttfb = response.elapsed.total_seconds()
+    return {
+        "dns_ms": None, "connect_ms": None, "tls_ms": None,
+        "ttfb_ms": ttfb * 1000, "transfer_ms": max(total - ttfb, 0.0) * 1000,
+    }
+"""
+
+# HDR-style latency histograms: values in microseconds are bucketed by their
+# top 8 significant bits, which keeps every bucket within ~0.4% of the values
+# it holds. Histograms are plain dicts of counts so worker processes can send
+# them back and the parent can merge them.
+HISTOGRAM_BLOCK = """
+import threading
+
+HISTOGRAM_SUB_BITS = 8
+histogram_lock = threading.Lock()
+latency_histograms = {}
+service_histograms = {}
+# Requests that raised (timeouts, resets) also count in latency, so overload
+# cannot drop the slowest samples; this kind reports them on their own.
+error_histograms = {}
+histogram_kinds = {"latency": latency_histograms, "service": service_histograms, "error": error_histograms}
+
+
+def histogram_key(seconds):
+    value = max(int(seconds * 1000000), 0)
+    shift = max(value.bit_length() - HISTOGRAM_SUB_BITS, 0)
+    return (shift << HISTOGRAM_SUB_BITS) | (value >> shift)
+
+
+def histogram_value_ms(key):
+    shift, top = key >> HISTOGRAM_SUB_BITS, key & ((1 << HISTOGRAM_SUB_BITS) - 1)
+    return ((top << shift) + ((1 << shift) >> 1)) / 1000
+
+
+def record_latency(name, latency, service=None, error=False):
+    with histogram_lock:
+        key = histogram_key(latency)
+        counts = latency_histograms.setdefault(name, {})
+        counts[key] = counts.get(key, 0) + 1
+        if error:
+            counts = error_histograms.setdefault(name, {})
+            counts[key] = counts.get(key, 0) + 1
+        if service is not None:
+            counts = service_histograms.setdefault(name, {})
+            key = histogram_key(service)
+            counts[key] = counts.get(key, 0) + 1
+
+
+def histogram_snapshot():
+    with histogram_lock:
+        return {kind: {name: dict(counts) for name, counts in histograms.items()}
+                for kind, histograms in histogram_kinds.items()}
+
+
+def merge_histograms(snapshot):
+    with histogram_lock:
+        for kind, histograms in histogram_kinds.items():
+            for name, counts in snapshot.get(kind, {}).items():
+                merged = histograms.setdefault(name, {})
+                for key, count in counts.items():
+                    key = int(key)
+                    merged[key] = merged.get(key, 0) + count
+
+
+def histogram_percentiles(counts, quantiles):
+    total = sum(counts.values())
+    keys = sorted(counts)
+    values = []
+    seen = 0
+    position = 0
+    for q in quantiles:
+        rank = max(q * total, 1)
+        while position < len(keys) and seen + counts[keys[position]] < rank:
+            seen += counts[keys[position]]
+            position += 1
+        values.append(histogram_value_ms(keys[min(position, len(keys) - 1)]))
+    return values
+
+
+def latency_summary():
+    quantiles = [0.5, 0.9, 0.99, 0.999, 1.0]
+    rows = []
+    for kind, histograms in histogram_kinds.items():
+        for name in sorted(histograms):
+            counts = histograms[name]
+            if not counts:
+                continue
+            p50, p90, p99, p999, max_ms = histogram_percentiles(counts, quantiles)
+            rows.append({
+                "request": name, "kind": kind, "count": sum(counts.values()),
+                "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "p99.9_ms": p999, "max_ms": max_ms,
+            })
+    return rows
+
+
+def print_latency_summary():
+    for row in latency_summary():
+        print(f"{row['request']} {row['kind']}: n={row['count']} p50={row['p50_ms']:.2f}ms "
+              f"p90={row['p90_ms']:.2f}ms p99={row['p99_ms']:.2f}ms p99.9={row['p99.9_ms']:.2f}ms")
+"""
+
+# Live progress for the UI: a background thread rewrites a small JSON snapshot
+# (counters plus a bounded series of per-interval rate, error rate and latency
+# percentiles) every metrics_interval seconds. Worker processes each write
+# their own file so no process ever waits on another. The counters live in
+# PROGRESS_BLOCK, which distributed workers also use for their report windows.
+PROGRESS_BLOCK = """
+metrics_lock = threading.Lock()
+metrics_counts = {"completed": 0, "failed": 0, "errors": 0}
+metrics_window = {}
+
+
+def record_progress(status_code, latency):
+    with metrics_lock:
+        metrics_counts["completed"] += 1
+        if status_code is None:
+            metrics_counts["errors"] += 1
+        elif status_code != 200:
+            metrics_counts["failed"] += 1
+        if latency is not None:
+            key = histogram_key(latency)
+            metrics_window[key] = metrics_window.get(key, 0) + 1
+"""
+
+METRICS_BLOCK = """
+import collections
+
+METRICS_HISTORY = 300
+metrics_series = collections.deque(maxlen=METRICS_HISTORY)
+metrics_state = {}
+metrics_stop = threading.Event()
+metrics_thread = None
+metrics_shard = None
+metrics_gauges = {}
+
+
+def metrics_path():
+    if metrics_shard is None:
+        return metrics_file
+    stem, ext = os.path.splitext(metrics_file)
+    return f"{stem}.{metrics_shard}{ext}"
+
+
+def write_metrics(done=False):
+    global metrics_window
+    now = time.perf_counter()
+    with metrics_lock:
+        counts = dict(metrics_counts)
+        window, metrics_window = metrics_window, {}
+    last = metrics_state["last_counts"]
+    completed = counts["completed"] - last["completed"]
+    bad = counts["failed"] + counts["errors"] - last["failed"] - last["errors"]
+    point = {
+        "elapsed_s": round(now - metrics_state["started"], 3),
+        "rps": completed / max(now - metrics_state["last_time"], 1e-9),
+        "error_rate": bad / completed if completed else 0.0,
+    }
+    if window:
+        point["p50_ms"], point["p90_ms"], point["p99_ms"] = histogram_percentiles(window, [0.5, 0.9, 0.99])
+    for name, gauge in metrics_gauges.items():
+        point[name] = gauge()
+    metrics_series.append(point)
+    metrics_state["last_time"] = now
+    metrics_state["last_counts"] = counts
+
+    snapshot = {"pid": os.getpid(), "shard": metrics_shard, "total": metrics_state["total"], "done": done,
+                "elapsed_s": point["elapsed_s"], **counts, "series": list(metrics_series)}
+    path = metrics_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    for attempt in range(5):
+        try:
+            os.replace(path + ".tmp", path)
+            break
+        except PermissionError:
+            # Windows refuses to replace a file a reader has open; retry shortly.
+            time.sleep(0.05)
+
+
+def metrics_worker():
+    while not metrics_stop.wait(metrics_interval):
+        write_metrics()
+
+
+def start_metrics(total):
+    global metrics_thread
+    now = time.perf_counter()
+    metrics_state.update(total=total, started=now, last_time=now, last_counts=dict(metrics_counts))
+    metrics_stop.clear()
+    metrics_thread = threading.Thread(target=metrics_worker, name="metrics-writer", daemon=True)
+    metrics_thread.start()
+
+
+def stop_metrics():
+    metrics_stop.set()
+    if metrics_thread is not None:
+        metrics_thread.join()
+    write_metrics(done=True)
+"""
+
+# Additive-increase/multiplicative-decrease limit on in-flight requests. The
+# limit grows by ~1 per round trip while short-term latency tracks its long-term
+# average and halves (at most once per smoothed round trip) on errors, 429/5xx
+# or a latency jump, so concurrency settles at what the target can absorb.
+AIMD_BLOCK = """
+class AimdLimit:
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(min(AIMD_INITIAL, maximum))
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.wakeup = None
+        self.wakeup_loop = None
+        self.baseline = None
+        self.smoothed = None
+        self.last_decrease = 0.0
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        # asyncio events bind to one event loop and every batch runs in a new one.
+        loop = asyncio.get_running_loop()
+        if self.wakeup_loop is not loop:
+            self.wakeup_loop = loop
+            self.wakeup = asyncio.Event()
+        while self.in_flight >= int(self.limit):
+            self.wakeup.clear()
+            await self.wakeup.wait()
+        self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def on_result(self, latency, ok):
+        with self.condition:
+            now = time.perf_counter()
+            if latency is not None:
+                self.smoothed = latency if self.smoothed is None else \\
+                    self.smoothed + AIMD_SMOOTHING * (latency - self.smoothed)
+                # The slow average is the reference; the fast one running well
+                # above it means requests are queueing at the target.
+                self.baseline = latency if self.baseline is None else \\
+                    self.baseline + AIMD_BASELINE_SMOOTHING * (latency - self.baseline)
+            congested = not ok or (self.smoothed is not None and
+                                   self.smoothed > AIMD_LATENCY_FACTOR * self.baseline)
+            if congested:
+                if now - self.last_decrease > (self.smoothed or 0):
+                    self.limit = max(1.0, self.limit * AIMD_DECREASE)
+                    self.last_decrease = now
+            else:
+                self.limit = min(float(self.maximum), self.limit + AIMD_INCREASE / self.limit)
+                self.condition.notify_all()
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+
+concurrency_limit = AimdLimit(threads)
+"""
+
+# Retries with full-jitter exponential backoff for exceptions and retryable
+# statuses, plus a consecutive-failure circuit breaker per request spec.
+RESILIENCE_BLOCK = """
+import threading
+
+from tenacity import AsyncRetrying, Retrying, retry_if_exception_type, retry_if_result, stop_after_attempt, \\
+    wait_random_exponential
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+breaker_lock = threading.Lock()
+
+
+def retryable_response(response):
+    return response.status_code in RETRY_STATUSES
+
+
+def retry_policy(retrying_class):
+    return retrying_class(
+        stop=stop_after_attempt(max_retries + 1),
+        wait=wait_random_exponential(multiplier=retry_backoff, max=retry_backoff_max),
+        retry=retry_if_exception_type(Exception) | retry_if_result(retryable_response),
+        # Once attempts run out, hand back the last response or raise its error.
+        retry_error_callback=lambda state: state.outcome.result(),
+    )
+
+
+def breaker_allows(spec):
+    if not breaker_threshold:
+        return True
+    with breaker_lock:
+        open_until = spec.get('breaker_open_until', 0.0)
+        if not open_until:
+            return True
+        now = time.perf_counter()
+        if now < open_until:
+            return False
+        # Half-open: a single probe goes through, everyone else waits another
+        # cooldown unless the probe succeeds and closes the circuit.
+        spec['breaker_open_until'] = now + breaker_cooldown
+        return True
+
+
+def record_breaker(spec, ok):
+    if not breaker_threshold:
+        return
+    with breaker_lock:
+        if ok:
+            if spec.get('breaker_open_until'):
+                print(f"Circuit closed for {spec['name']}")
+            spec['breaker_failures'] = 0
+            spec['breaker_open_until'] = 0.0
+            return
+        spec['breaker_failures'] = spec.get('breaker_failures', 0) + 1
+        if spec['breaker_failures'] == breaker_threshold:
+            spec['breaker_open_until'] = time.perf_counter() + breaker_cooldown
+            print(f"Circuit opened for {spec['name']} after {breaker_threshold} consecutive failures")
+"""
+
+# Open-loop pacing. Each token's due time is the request's intended send time;
+# latency is measured from it, so time spent queued behind busy workers shows
+# up as latency instead of silently lowering the offered load (coordinated
+# omission).
+RATE_PROFILE_BLOCK = """
+
+def rate_at(elapsed):
+    rate = target_rps * rate_share
+    if rate_profile == "ramp":
+        # The floor scales with the target, so slow ramps never start above it.
+        return max(rate * min(elapsed / profile_seconds, 1.0), rate * RAMP_FLOOR)
+    if rate_profile == "step":
+        return rate * min(int(elapsed // profile_seconds) + 1, RATE_STEPS) / RATE_STEPS
+    if rate_profile == "spike":
+        in_spike = elapsed % profile_seconds >= profile_seconds * (1 - SPIKE_FRACTION)
+        return rate * SPIKE_FACTOR if in_spike else rate
+    return rate
+
+
+class TokenBucket:
+    def __init__(self):
+        # Distributed workers share the coordinator's start as time zero of the profile.
+        self.due = time.perf_counter()
+        self.started = self.due if schedule_started is None else schedule_started
+
+    def take(self):
+        due = self.due
+        self.due += 1.0 / max(rate_at(due - self.started), 0.001)
+        return due
+"""
+
+# The run's (request index, iteration) pairs as a lazy sequence. Shards and
+# distributed leases are slices of it, so nothing proportional to total_runs is
+# ever materialized.
+WORK_PLAN_BLOCK = """
+
+class WorkPlan:
+    def __init__(self, per_iteration, positions=None):
+        self.per_iteration = per_iteration
+        self.positions = range(total_runs * per_iteration) if positions is None else positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return WorkPlan(self.per_iteration, self.positions[key])
+        position = self.positions[key]
+        return position % self.per_iteration, position // self.per_iteration + 1
+
+    def __iter__(self):
+        for position in self.positions:
+            yield position % self.per_iteration, position // self.per_iteration + 1
+"""
+
+# Threaded runners submit at most QUEUED_PER_THREAD requests per thread ahead
+# of the pool, so pending futures stay bounded however long the run is.
+THREAD_SUBMIT_BLOCK = """
+
+def finish_submitted(future):
+    submit_slots.release()
+    try:
+        future.result()
+    except Exception as e:
+        print(f"Error in thread: {e}")
+
+
+submit_slots = threading.BoundedSemaphore(threads * QUEUED_PER_THREAD)
+"""
+
+# Record/replay transport and profiling hooks. --record saves each request's
+# responses (at most CASSETTE_MAX_RESPONSES, bodies stored once) to a gzipped
+# cassette; --replay answers every request from it in memory, so the runner's
+# own throughput and CPU profile can be measured without a network. Recorded
+# and replayed responses are the same small in-memory class, which the search,
+# save and report code use like any other response.
+CASSETTE_BLOCK = """
+import base64
+import cProfile
+import gzip
+import hashlib
+import io
+import itertools
+import pstats
+import re
+import sys
+import threading
+from datetime import timedelta
+
+CASSETTE_VERSION = 1
+CASSETTE_MAX_RESPONSES = 16
+CASSETTE_CHUNK_SIZE = 65536
+CASSETTE_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+CHARSET_RE = re.compile(r"charset=([\\w.-]+)", re.I)
+cassette_lock = threading.Lock()
+cassette = {}
+replay_cycles = {}
+cassette_mode = None
+cassette_path = None
+profile_state = {}
+
+
+class CassetteHeaders(dict):
+    def __init__(self, headers):
+        super().__init__((name.lower(), value) for name, value in headers.items())
+
+    def __getitem__(self, name):
+        return super().__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super().__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class CassetteResponse:
+    # Stateless, so one replayed response can serve many requests at once.
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CassetteHeaders(headers)
+        self.content = content
+        self.elapsed = timedelta(0)
+        charset = CHARSET_RE.search(self.headers.get("content-type", ""))
+        self.encoding = charset.group(1) if charset else "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=CASSETTE_CHUNK_SIZE):
+        for start in range(0, len(self.content), chunk_size or CASSETTE_CHUNK_SIZE):
+            yield self.content[start:start + (chunk_size or CASSETTE_CHUNK_SIZE)]
+
+    async def aiter_content(self, chunk_size=CASSETTE_CHUNK_SIZE):
+        for chunk in self.iter_content(chunk_size):
+            yield chunk
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+def keep_response(spec, response, body):
+    headers = {name: value for name, value in response.headers.items()
+               if name.lower() not in CASSETTE_DROPPED_HEADERS}
+    recorded = CassetteResponse(response.status_code, headers, body)
+    with cassette_lock:
+        responses = cassette.setdefault(spec["name"], [])
+        if len(responses) < CASSETTE_MAX_RESPONSES:
+            responses.append(recorded)
+    return recorded
+
+
+def record_response(spec, response, kwargs):
+    if kwargs.get("stream"):
+        try:
+            body = b"".join(response.iter_content(chunk_size=CASSETTE_CHUNK_SIZE))
+        finally:
+            response.close()
+    else:
+        body = response.content
+    return keep_response(spec, response, body)
+
+
+async def record_response_async(spec, response, kwargs):
+    if kwargs.get("stream"):
+        try:
+            body = b"".join([chunk async for chunk in response.aiter_content()])
+        finally:
+            await response.aclose()
+    else:
+        body = response.content
+    return keep_response(spec, response, body)
+
+
+def replay_response(spec):
+    responses = replay_cycles.get(spec["name"])
+    if responses is None:
+        raise LookupError(f"No recorded response for {spec['name']} in {cassette_path}")
+    return next(responses)
+
+
+def save_cassette(path):
+    bodies = {}
+    requests_recorded = {}
+    for name, responses in cassette.items():
+        entries = requests_recorded[name] = []
+        for response in responses:
+            digest = hashlib.sha256(response.content).hexdigest()
+            bodies.setdefault(digest, base64.b64encode(response.content).decode("ascii"))
+            entries.append({"status_code": response.status_code, "headers": dict(response.headers), "body": digest})
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"version": CASSETTE_VERSION, "requests": requests_recorded, "bodies": bodies}, f)
+    print(f"Recorded {sum(len(entries) for entries in requests_recorded.values())} responses to {path}")
+
+
+def load_cassette(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != CASSETTE_VERSION:
+        raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+    bodies = {digest: base64.b64decode(body) for digest, body in data["bodies"].items()}
+    for name, entries in data["requests"].items():
+        cassette[name] = [CassetteResponse(entry["status_code"], entry["headers"], bodies[entry["body"]])
+                          for entry in entries]
+        replay_cycles[name] = itertools.cycle(cassette[name])
+
+
+def profile_thread(frame, event, arg):
+    # Installed by threading.setprofile: every new worker thread swaps this
+    # hook for its own cProfile profiler on its first event.
+    profiler = cProfile.Profile()
+    with cassette_lock:
+        profile_state["thread_profilers"].append(profiler)
+    sys.setprofile(None)
+    profiler.enable()
+
+
+def begin_diagnostics(record=None, replay=None, profile=None):
+    global cassette_mode, cassette_path
+    if record and replay:
+        raise ValueError("--record and --replay cannot be combined")
+    if replay:
+        cassette_mode, cassette_path = "replay", replay
+        load_cassette(replay)
+    elif record:
+        cassette_mode, cassette_path = "record", record
+    if profile == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("--profile pyinstrument needs the pyinstrument package") from None
+        # pyinstrument samples the main thread; pair it with the async engine.
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        profile_state.update(kind=profile, profiler=profiler)
+    elif profile == "cprofile":
+        profiler = cProfile.Profile()
+        profile_state.update(kind=profile, profiler=profiler, thread_profilers=[])
+        threading.setprofile(profile_thread)
+        profiler.enable()
+
+
+def diagnostics_active():
+    return cassette_mode is not None or bool(profile_state)
+
+
+def end_diagnostics():
+    stem = os.path.splitext(report_filename)[0]
+    kind = profile_state.pop("kind", None)
+    if kind == "cprofile":
+        profile_state["profiler"].disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(profile_state["profiler"])
+        for profiler in profile_state["thread_profilers"]:
+            stats.add(profiler)
+        stats.dump_stats(f"{stem}.prof")
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("tottime").print_stats(25)
+        print(summary.getvalue())
+        print(f"Profile saved to {stem}.prof")
+    elif kind == "pyinstrument":
+        profiler = profile_state["profiler"]
+        profiler.stop()
+        with open(f"{stem}.profile.html", "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+        print(profiler.output_text(unicode=True, color=False))
+        print(f"Profile saved to {stem}.profile.html")
+    if cassette_mode == "record":
+        save_cassette(cassette_path)
+"""
+
+
+# Coordinator/worker mode: the same script either hands out leases (ranges of
+# the work list) over a small HTTP control channel or runs them as a worker.
+# Workers start together at a time set by the coordinator, post per-window
+# deltas of their counters and latency histograms on a grid aligned to that
+# start, and send their results when the work runs out. A worker that stops
+# reporting has its open lease handed to the others. Only workers the
+# coordinator spawned itself leave result files for it to merge; remote
+# workers upload their rows over the control channel.
+DISTRIBUTED_BLOCK = """
+import hashlib
+import secrets
+import socket
+import subprocess
+import sys
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORKER_TIMEOUT = 30.0
+START_DELAY = 1.0
+LOCAL_WORKER_TOKEN = "LOCAL_WORKER_TOKEN"
+coordinator_lock = threading.Condition()
+coordinator_state = {}
+window_state = {"index": 0, "counts": {}, "histograms": {}, "unsent": []}
+worker_stop = threading.Event()
+worker_arguments = []
+
+
+def script_fingerprint():
+    digest = hashlib.sha256()
+    for path in fingerprint_files:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def control_request(base_url, path, payload, timeout=60):
+    request = urllib.request.Request(base_url.rstrip("/") + path, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def histogram_delta(current, previous):
+    delta = {}
+    for name, counts in current.items():
+        before = previous.get(name, {})
+        changed = {key: count - before.get(key, 0) for key, count in counts.items() if count != before.get(key, 0)}
+        if changed:
+            delta[name] = changed
+    return delta
+
+
+def take_window():
+    with metrics_lock:
+        counts = dict(metrics_counts)
+    histograms = histogram_snapshot()
+    window = {"index": window_state["index"]}
+    for key, count in counts.items():
+        window[key] = count - window_state["counts"].get(key, 0)
+    for kind in histogram_kinds:
+        window[kind] = histogram_delta(histograms[kind], window_state["histograms"].get(kind, {}))
+    window_state.update(index=window_state["index"] + 1, counts=counts, histograms=histograms)
+    return window
+
+
+def send_windows(coordinator_url, worker_id, extra=None):
+    # Windows that could not be delivered are kept and sent with the next report.
+    window_state["unsent"].append(take_window())
+    payload = {"worker_id": worker_id, "windows": window_state["unsent"], **(extra or {})}
+    try:
+        control_request(coordinator_url, "/report", payload)
+        window_state["unsent"] = []
+    except OSError as e:
+        if extra:
+            raise
+        print(f"Report to coordinator failed, retrying with the next window: {e}")
+
+
+def upload_rows(coordinator_url, worker_id, output):
+    if not os.path.exists(output):
+        return
+    batch = []
+    for row in iter_result_rows(output):
+        batch.append(row)
+        if len(batch) >= results_batch_size:
+            control_request(coordinator_url, "/rows", {"worker_id": worker_id, "rows": batch})
+            batch = []
+    if batch:
+        control_request(coordinator_url, "/rows", {"worker_id": worker_id, "rows": batch})
+    os.remove(output)
+
+
+def report_worker(coordinator_url, worker_id, start_at):
+    while not worker_stop.wait(max(start_at + (window_state["index"] + 1) * report_interval - time.time(), 0)):
+        send_windows(coordinator_url, worker_id)
+
+
+def run_worker(coordinator_url, work):
+    global rate_share, schedule_started, metrics_shard
+    registration = control_request(coordinator_url, "/register", {
+        "fingerprint": script_fingerprint(), "host": socket.gethostname(), "pid": os.getpid(),
+        "token": os.environ.get(LOCAL_WORKER_TOKEN, ""),
+    }, timeout=None)
+    worker_id = registration["worker_id"]
+    start_at = registration["start_at"]
+    rate_share = registration["rate_share"]
+    metrics_shard = f"w{worker_id}"
+    schedule_started = time.perf_counter() + start_at - time.time()
+    time.sleep(max(start_at - time.time(), 0))
+    print(f"Worker {worker_id} started")
+
+    def leased_batches():
+        while True:
+            lease = control_request(coordinator_url, "/lease", {"worker_id": worker_id})
+            if lease.get("done"):
+                return
+            yield work[lease["start"]:lease["stop"]]
+
+    reporter = threading.Thread(target=report_worker, args=(coordinator_url, worker_id, start_at),
+                                name="window-reporter", daemon=True)
+    reporter.start()
+    begin_shard(f"w{worker_id}")
+    try:
+        run_batches(leased_batches(), round(len(work) * rate_share))
+    finally:
+        output = finish_shard()
+        worker_stop.set()
+        reporter.join()
+        if results_format:
+            if not registration["local"]:
+                upload_rows(coordinator_url, worker_id, output)
+            # The coordinator finds a local worker's part file itself.
+            output = None
+        send_windows(coordinator_url, worker_id, {"done": True, "host": socket.gethostname(), "output": output})
+    print(f"Worker {worker_id} finished")
+
+
+def merge_window(window):
+    merge_histograms(window)
+    slot = coordinator_state["windows"].setdefault(
+        window["index"], {"workers": 0, "completed": 0, "failed": 0, "errors": 0, "latency": {}})
+    slot["workers"] += 1
+    for key in ("completed", "failed", "errors"):
+        slot[key] += window.get(key, 0)
+    for counts in window["latency"].values():
+        for key, count in counts.items():
+            slot["latency"][int(key)] = slot["latency"].get(int(key), 0) + count
+
+
+def coordinator_reply(path, payload):
+    state = coordinator_state
+    now = time.time()
+    with coordinator_lock:
+        worker_id = payload.get("worker_id")
+        if path == "/register":
+            if payload.get("fingerprint") != state["fingerprint"]:
+                return 409, {"error": "worker script does not match the coordinator's script"}
+            worker_id = len(state["hosts"])
+            state["hosts"][worker_id] = payload.get("host")
+            if secrets.compare_digest(payload.get("token", ""), state["token"]):
+                state["local"].add(worker_id)
+            if state["start_at"] is None and len(state["hosts"]) >= state["expected"]:
+                state["start_at"] = now + START_DELAY
+                coordinator_lock.notify_all()
+            while state["start_at"] is None:
+                coordinator_lock.wait()
+            state["last_seen"][worker_id] = now
+            print(f"Worker {worker_id} registered from {payload.get('host')} (pid {payload.get('pid')})")
+            return 200, {"worker_id": worker_id, "start_at": state["start_at"], "rate_share": 1.0 / state["expected"],
+                         "local": worker_id in state["local"]}
+        if worker_id not in state["hosts"]:
+            return 404, {"error": f"unknown worker {worker_id}"}
+        state["last_seen"][worker_id] = now
+        if path == "/lease":
+            # Asking for a lease completes the previous one.
+            state["leases"].pop(worker_id, None)
+            if worker_id in state["lost"]:
+                return 200, {"done": True}
+            if state["requeued"]:
+                lease = state["requeued"].pop()
+            elif state["next"] < state["total"]:
+                lease = (state["next"], min(state["next"] + lease_size, state["total"]))
+                state["next"] = lease[1]
+            else:
+                return 200, {"done": True}
+            state["leases"][worker_id] = lease
+            return 200, {"start": lease[0], "stop": lease[1]}
+        if path == "/rows":
+            write_results([dict(zip(result_columns, row)) for row in payload.get("rows", [])])
+            return 200, {}
+        if path == "/report":
+            for window in payload.get("windows", []):
+                merge_window(window)
+            if payload.get("done"):
+                state["leases"].pop(worker_id, None)
+                state["finished"].add(worker_id)
+                state["outputs"].append((worker_id, payload.get("host"), payload.get("output")))
+                coordinator_lock.notify_all()
+            return 200, {}
+    return 404, {"error": f"unknown control path {path}"}
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        status, reply = coordinator_reply(self.path, json.loads(self.rfile.read(length) or b"{}"))
+        body = json.dumps(reply).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def coordinator_finished():
+    state = coordinator_state
+    return (state["start_at"] is not None and state["next"] >= state["total"] and not state["requeued"]
+            and not state["leases"] and all(w in state["finished"] or w in state["lost"] for w in state["hosts"]))
+
+
+def expire_workers():
+    state = coordinator_state
+    now = time.time()
+    if state["start_at"] is None or now - state["start_at"] < WORKER_TIMEOUT:
+        return
+    for worker_id, seen in state["last_seen"].items():
+        if worker_id in state["finished"] or worker_id in state["lost"] or now - seen < WORKER_TIMEOUT:
+            continue
+        state["lost"].add(worker_id)
+        lease = state["leases"].pop(worker_id, None)
+        if lease:
+            state["requeued"].append(lease)
+        print(f"Worker {worker_id} stopped reporting; lease {lease} goes back to the queue")
+
+
+def write_windows():
+    rows = []
+    for index in sorted(coordinator_state["windows"]):
+        slot = coordinator_state["windows"][index]
+        row = {
+            "window": index, "start_s": index * report_interval, "workers": slot["workers"],
+            "completed": slot["completed"], "failed": slot["failed"], "errors": slot["errors"],
+            "rps": slot["completed"] / report_interval,
+            "error_rate": (slot["failed"] + slot["errors"]) / slot["completed"] if slot["completed"] else 0.0,
+        }
+        if slot["latency"]:
+            row["p50_ms"], row["p90_ms"], row["p99_ms"] = histogram_percentiles(slot["latency"], [0.5, 0.9, 0.99])
+        rows.append(row)
+    path = f"{os.path.splitext(report_filename)[0]}.windows.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"start_at": coordinator_state["start_at"], "report_interval": report_interval,
+                   "workers": coordinator_state["hosts"], "windows": rows}, f, indent=2)
+    print(f"Per-window aggregates saved to {path}")
+
+
+def run_coordinator(address, expected, spawn_local, work):
+    host, _, port = address.rpartition(":")
+    coordinator_state.update(
+        fingerprint=script_fingerprint(), expected=max(expected, spawn_local, 1), total=len(work), next=0,
+        start_at=None, hosts={}, last_seen={}, leases={}, requeued=[], lost=set(), finished=set(),
+        outputs=[], windows={}, token=secrets.token_hex(16), local=set(),
+    )
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), ControlHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="control-server", daemon=True).start()
+    url = f"http://{host if host not in ('', '0.0.0.0') else '127.0.0.1'}:{server.server_port}"
+    print(f"Coordinator listening on {url}, waiting for {coordinator_state['expected']} worker(s)")
+    # The token marks the workers spawned here; they share this directory.
+    spawn_env = {**os.environ, LOCAL_WORKER_TOKEN: coordinator_state["token"]}
+    spawned = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", url, *worker_arguments],
+                                env=spawn_env)
+               for _ in range(spawn_local)]
+    try:
+        with coordinator_lock:
+            while not coordinator_finished():
+                coordinator_lock.wait(1.0)
+                expire_workers()
+                if spawned and all(process.poll() is not None for process in spawned) and not coordinator_finished():
+                    raise RuntimeError("Local workers exited before the run completed")
+    finally:
+        server.shutdown()
+        for process in spawned:
+            process.wait()
+
+    outputs = []
+    for worker_id, worker_host, output in sorted(coordinator_state["outputs"], key=lambda item: item[0]):
+        if results_format:
+            # Remote rows were already written as they arrived; a reported path is never trusted.
+            if worker_id not in coordinator_state["local"]:
+                continue
+            output = shard_results_path(f"w{worker_id}")
+        outputs.append(output)
+    collect_shards(outputs)
+    write_windows()
+"""
+
+# Streams result rows to an append-only file in batches so memory stays flat
+# however many iterations run; the Excel report is rendered from that file.
+RESULTS_SINK_BLOCK = """
+import csv
+import os
+import threading
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+EXCEL_MAX_ROWS = 1048576
+results_lock = threading.Lock()
+results_write_lock = threading.Lock()
+results_path = results_file
+results_handle = None
+
+
+def record_result(row):
+    with results_lock:
+        results.append(row)
+        if len(results) < results_batch_size:
+            return
+        batch = results[:]
+        del results[:]
+    write_results(batch)
+
+
+def flush_results():
+    with results_lock:
+        batch = results[:]
+        del results[:]
+    write_results(batch)
+
+
+def write_results(batch):
+    global results_handle
+    if not batch:
+        return
+    with results_write_lock:
+        if results_format == "parquet":
+            schema = pa.schema([(c, pa.type_for_alias(t)) for c, t in zip(result_columns, result_types)])
+            if results_handle is None:
+                results_handle = pq.ParquetWriter(results_path, schema)
+            results_handle.write_table(pa.Table.from_pylist(batch, schema=schema))
+        elif results_format == "csv":
+            if results_handle is None:
+                results_handle = open(results_path, "w", newline="", encoding="utf-8")
+                csv.writer(results_handle).writerow(result_columns)
+            writer = csv.writer(results_handle)
+            writer.writerows([row.get(column) for column in result_columns] for row in batch)
+            results_handle.flush()
+        else:
+            if results_handle is None:
+                results_handle = open(results_path, "w", encoding="utf-8")
+            results_handle.writelines(json.dumps(row, ensure_ascii=False) + "\\n" for row in batch)
+            results_handle.flush()
+
+
+def close_results():
+    global results_handle
+    flush_results()
+    if results_handle is not None:
+        results_handle.close()
+        results_handle = None
+
+
+def iter_result_rows(path):
+    if results_format == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=results_batch_size):
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+    elif results_format == "csv":
+        converters = {"int64": int, "float64": float}
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                yield [converters[t](v) if v and t in converters else v for v, t in zip(row, result_types)]
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                yield [row.get(column) for column in result_columns]
+
+
+def merge_result_parts(part_paths):
+    global results_path
+    # Rows uploaded by remote workers may already be open in results_file.
+    results_path = results_file
+    for part_path in part_paths:
+        if not os.path.exists(part_path):
+            # A shard whose every request failed never opened its part file.
+            continue
+        batch = []
+        for row in iter_result_rows(part_path):
+            batch.append(dict(zip(result_columns, row)))
+            if len(batch) >= results_batch_size:
+                write_results(batch)
+                batch = []
+        write_results(batch)
+        os.remove(part_path)
+    close_results()
+
+
+def render_report():
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("results")
+    sheet.append(result_columns)
+    if os.path.exists(results_file):
+        for n, row in enumerate(iter_result_rows(results_file), 1):
+            if n >= EXCEL_MAX_ROWS:
+                print(f"Excel row limit reached, full results are in {results_file}")
+                break
+            sheet.append(list(row))
+    summary = latency_summary()
+    if summary:
+        sheet = workbook.create_sheet("latency")
+        sheet.append(list(summary[0]))
+        for row in summary:
+            sheet.append(list(row.values()))
+    workbook.save(report_filename)
+"""
+
+
+# Searches the response body chunk by chunk on raw bytes. A window of the
+# previous chunk's tail catches patterns that straddle a chunk boundary, and
+# several patterns are matched in a single pass by one compiled alternation.
+STREAM_SEARCH_BLOCK = """
+import re
+
+SEARCH_CHUNK_SIZE = 65536
+
+
+def compile_patterns(texts):
+    patterns = sorted({text.encode("utf-8") for text in texts if text}, key=len, reverse=True)
+    if not patterns:
+        return None, 0
+    return re.compile(b"|".join(re.escape(p) for p in patterns)), len(patterns[0]) - 1
+
+
+def scan_chunk(matcher, overlap, tail, chunk):
+    match = matcher.search(tail + chunk[:overlap]) if tail else None
+    if match is None:
+        match = matcher.search(chunk)
+    if len(chunk) >= overlap:
+        tail = chunk[len(chunk) - overlap:] if overlap else b""
+    else:
+        tail = (tail + chunk)[-overlap:]
+    return match, tail
+
+
+def stop_reading(found, received):
+    if found is not None:
+        return close_on_match
+    return bool(search_byte_limit) and received >= search_byte_limit
+"""
+
+STREAM_SEARCH_SYNC_BLOCK = """
+
+def search_stream(response, search):
+    matcher, overlap = search
+    chunks = []
+    tail = b""
+    found = None
+    received = 0
+    try:
+        for chunk in response.iter_content(chunk_size=SEARCH_CHUNK_SIZE):
+            chunks.append(chunk)
+            received += len(chunk)
+            if found is None:
+                match, tail = scan_chunk(matcher, overlap, tail, chunk)
+                if match is not None:
+                    found = match.group(0).decode("utf-8", "replace")
+            if stop_reading(found, received):
+                break
+    finally:
+        response.close()
+    return found, b"".join(chunks) if found is not None else b""
+"""
+
+STREAM_SEARCH_ASYNC_BLOCK = """
+
+async def search_stream(response, search):
+    matcher, overlap = search
+    chunks = []
+    tail = b""
+    found = None
+    received = 0
+    try:
+        async for chunk in response.aiter_content():
+            chunks.append(chunk)
+            received += len(chunk)
+            if found is None:
+                match, tail = scan_chunk(matcher, overlap, tail, chunk)
+                if match is not None:
+                    found = match.group(0).decode("utf-8", "replace")
+            if stop_reading(found, received):
+                break
+    finally:
+        await response.aclose()
+    return found, b"".join(chunks) if found is not None else b""
+"""
+
+
+# Encodes everything that is the same on every iteration exactly once. The
+# requests backend gets a PreparedRequest that Session.send reuses as is;
+# curl_cffi has no prepared request, so the query string, cookies and body
+# are pre-encoded into the URL, headers and bytes it is handed each time.
+PREPARED_TEMPLATE_BLOCK = """
+import weakref
+
+
+def prepare_template(spec, kwargs):
+    params = kwargs.pop("params")
+    headers = dict(kwargs.pop("headers"))
+    cookies = kwargs.pop("cookies")
+    files = kwargs.pop("files")
+    json_body = kwargs.pop("json", None)
+    data = kwargs.pop("data", None)
+    if prepare_with_requests and spec["backend"] == "requests":
+        # Prepared per thread by prepared_request, through that thread's session.
+        spec["prepared"] = requests.Request(
+            spec["method"], spec["url"], params=params, headers=headers, cookies=cookies,
+            files=files, data=data, json=json_body
+        )
+        return
+    url = spec["url"]
+    if params:
+        url += ("&" if "?" in url else "?") + urllib.parse.urlencode(params, doseq=True)
+    if cookies:
+        headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+    has_content_type = any(name.lower() == "content-type" for name in headers)
+    if json_body is not None:
+        if not has_content_type:
+            headers["Content-Type"] = "application/json"
+        kwargs["data"] = json.dumps(json_body, separators=(",", ":")).encode("utf-8")
+    elif isinstance(data, dict) and data:
+        if not has_content_type:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        kwargs["data"] = urllib.parse.urlencode(data, doseq=True).encode("utf-8")
+    elif data:
+        kwargs["data"] = data.encode("utf-8") if isinstance(data, str) else data
+    if files:
+        kwargs["files"] = files
+    kwargs["headers"] = headers
+    spec["send_url"] = url
+
+
+def prepared_request(spec):
+    # Session.prepare_request merges the session's default headers, cookies and
+    # auth, so the wire request matches the unprepared path. The result is
+    # reused until the thread's cookie jar changes.
+    session = get_session("requests")
+    cache = getattr(thread_local, "prepared", None)
+    if cache is None:
+        cache = thread_local.prepared = weakref.WeakKeyDictionary()
+    jar = tuple((cookie.domain, cookie.path, cookie.name, cookie.value) for cookie in session.cookies)
+    entry = cache.get(spec["prepared"])
+    if entry is None or entry[0] != jar:
+        entry = cache[spec["prepared"]] = (jar, session.prepare_request(spec["prepared"]))
+    return entry[1]
+"""
+
+
+# File uploads: each referenced file is memory-mapped once per process and
+# shared by every request that sends it. requests streams the body straight
+# from the mapping; curl_cffi (and so the async engine) only accepts bytes, so
+# it gets a single buffer per request spec. Multipart bodies are encoded once around the mapped files.
+UPLOAD_BODY_BLOCK = """
+import mimetypes
+import mmap
+import uuid
+
+mapped_files = {}
+# Percent-encoded in multipart name/filename parameters, as urllib3 and browsers do.
+MULTIPART_ESCAPES = {10: "%0A", 13: "%0D", 34: "%22"}
+# curl's own default for a -d/--data-binary body without a Content-Type header.
+DEFAULT_BODY_TYPE = "application/x-www-form-urlencoded"
+
+
+class MappedBody:
+    # Re-iterable body of byte strings and mapped file views; it has a length,
+    # so requests sends it with a Content-Length instead of chunked.
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.size = sum(len(part) for part in parts)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.parts)
+
+
+def mapped_file(path):
+    view = mapped_files.get(path)
+    if view is None:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                view = memoryview(b"")
+        mapped_files[path] = view
+    return view
+
+
+def upload_body(spec, headers):
+    if spec["body_file"]:
+        parts = [mapped_file(spec["body_file"])]
+        if not any(k.lower() == "content-type" for k in headers):
+            headers = {**headers, "Content-Type": DEFAULT_BODY_TYPE}
+    else:
+        boundary = uuid.uuid4().hex
+        fields = spec["data"] if isinstance(spec["data"], dict) else {}
+        parts = []
+        for name, value in [*fields.items(), *spec["files"].items()]:
+            name = name.translate(MULTIPART_ESCAPES)
+            if isinstance(value, dict):
+                filename = value.get("filename") or os.path.basename(value["path"])
+                content_type = value.get("type") or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                filename = filename.translate(MULTIPART_ESCAPES)
+                parts.append(f'--{boundary}\\r\\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\\r\\n'
+                             f'Content-Type: {content_type}\\r\\n\\r\\n'.encode("utf-8"))
+                parts.append(mapped_file(value["path"]))
+                parts.append(b"\\r\\n")
+            else:
+                parts.append(f'--{boundary}\\r\\nContent-Disposition: form-data; name="{name}"\\r\\n\\r\\n{value}\\r\\n'
+                             .encode("utf-8"))
+        parts.append(f"--{boundary}--\\r\\n".encode("utf-8"))
+        headers = {k: v for k, v in headers.items() if k.lower() != "content-type"}
+        headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+    if spec["backend"] == "curl_cffi" or not upload_from_mapping:
+        return headers, b"".join(parts)
+    return headers, MappedBody(parts)
+"""
+
+
+# Matched responses are handed to a single writer thread as raw bytes, so
+# request workers never parse, re-serialise or write bodies themselves. Files
+# are named by the SHA-256 of the body, which stores identical bodies once.
+BACKGROUND_SAVE_BLOCK = """
+import gzip
+import hashlib
+import queue
+import tempfile
+import threading
+
+if save_compression == "zstd":
+    import zstandard
+
+SAVE_QUEUE_SIZE = 1000
+save_queue = queue.Queue(maxsize=SAVE_QUEUE_SIZE)
+save_thread = None
+save_thread_lock = threading.Lock()
+saved_digests = set()
+
+
+def save_item(response, body):
+    global save_thread
+    if save_thread is None:
+        with save_thread_lock:
+            if save_thread is None:
+                save_thread = threading.Thread(target=save_worker, daemon=True)
+                save_thread.start()
+    return response.headers.get("Content-Type", ""), response.content if body is None else body
+
+
+def save_response(spec, response, body=None):
+    save_queue.put(save_item(response, body))
+
+
+async def save_response_async(spec, response, body=None):
+    item = save_item(response, body)
+    try:
+        save_queue.put_nowait(item)
+    except queue.Full:
+        # The writer is behind: wait for room off the event loop, so requests
+        # in flight keep running and their latencies stay honest.
+        await asyncio.to_thread(save_queue.put, item)
+
+
+def save_worker():
+    if save_compression == "zstd":
+        compress, suffix = zstandard.ZstdCompressor().compress, ".zst"
+    elif save_compression == "gzip":
+        compress, suffix = gzip.compress, ".gz"
+    else:
+        compress, suffix = None, ""
+    while True:
+        item = save_queue.get()
+        if item is None:
+            break
+        content_type, body = item
+        digest = hashlib.sha256(body).hexdigest()
+        if digest in saved_digests:
+            continue
+        saved_digests.add(digest)
+        if "application/json" in content_type:
+            ext = ".json"
+        elif "text/html" in content_type:
+            ext = ".html"
+        else:
+            ext = ".txt"
+        path = f"{response_dir}/response_{digest}{ext}{suffix}"
+        if os.path.exists(path):
+            continue
+        # A unique temp name, since other processes may be saving the same digest.
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=response_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(compress(body) if compress else body)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not save response {digest}: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def close_saver():
+    global save_thread
+    if save_thread is not None:
+        save_queue.put(None)
+        save_thread.join()
+        save_thread = None
+"""
+
+# Session setup: one extracted request (typically a login) runs once per worker
+# process instead of being replayed with every iteration. Its response cookies
+# and extracted values are shared by all threads/tasks of the process, and
+# {{name}} placeholders in the other requests are filled from them. Each spec
+# keeps a rendered copy per setup generation, so placeholders are substituted
+# once per refresh rather than per request.
+SESSION_SETUP_BLOCK = """
+import re
+from http.cookies import SimpleCookie
+
+PLACEHOLDER_RE = re.compile(r"\\{\\{\\s*(\\w+)\\s*\\}\\}")
+AUTH_STATUS = 401
+auth_state = {"values": {}, "cookies": {}, "expires": 0.0, "generation": 0}
+
+
+def render_value(value, values):
+    if isinstance(value, str):
+        return PLACEHOLDER_RE.sub(lambda match: values.get(match.group(1), match.group(0)), value)
+    if isinstance(value, dict):
+        return {key: render_value(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render_value(item, values) for item in value]
+    return value
+
+
+def response_cookies(response):
+    cookies = getattr(response, "cookies", None)
+    if cookies is None:
+        # Replayed responses only carry the Set-Cookie header.
+        parsed = SimpleCookie(response.headers.get("set-cookie", ""))
+        return {name: morsel.value for name, morsel in parsed.items()}
+    return {cookie.name: cookie.value for cookie in getattr(cookies, "jar", cookies)}
+
+
+def extract_value(response, rule):
+    kind, _, expression = rule.partition(":")
+    if kind == "json":
+        value = jmespath.search(expression, response.json())
+    elif kind in ("css", "xpath"):
+        value = getattr(parsel.Selector(text=response.text, type="html"), kind)(expression).get()
+    elif kind == "regex":
+        match = re.search(expression, response.text)
+        value = match and match.group(1 if match.re.groups else 0)
+    elif kind == "cookie":
+        value = response_cookies(response).get(expression)
+    else:
+        value = response.headers.get(expression)
+    if value is None:
+        raise LookupError(f"Session setup found nothing for {rule!r}")
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def apply_setup(response, started):
+    if response.status_code >= 400:
+        raise RuntimeError(f"Session setup failed with status {response.status_code}")
+    values = {name: extract_value(response, rule) for name, rule in setup_extract.items()}
+    auth_state["values"] = values
+    auth_state["cookies"] = response_cookies(response)
+    auth_state["generation"] += 1
+    now = time.perf_counter()
+    auth_state["expires"] = now + setup_ttl if setup_ttl else float("inf")
+    print(f"Session setup #{auth_state['generation']} took {(now - started) * 1000:.0f} ms "
+          f"({len(values)} values, {len(auth_state['cookies'])} cookies)")
+
+
+def expire_auth(spec):
+    # Only the generation that was rejected is dropped; a concurrent refresh
+    # that already replaced it is kept.
+    if spec["auth_generation"] == auth_state["generation"]:
+        auth_state["expires"] = 0.0
+
+
+def authorized_copy(spec):
+    copy = spec.get("authorized")
+    if copy is None or copy["auth_generation"] != auth_state["generation"]:
+        values = auth_state["values"]
+        copy = {key: render_value(value, values) if key in ("url", "params", "headers", "cookies", "data", "json")
+                else value for key, value in spec.items() if key != "authorized"}
+        copy["cookies"] = {**copy["cookies"], **auth_state["cookies"]}
+        copy["auth_generation"] = auth_state["generation"]
+        prepare_spec(copy)
+        spec["authorized"] = copy
+    return copy
+"""
+
+SESSION_SETUP_SYNC_BLOCK = """
+import threading
+
+auth_lock = threading.Lock()
+
+
+def authorized_spec(spec):
+    if time.perf_counter() >= auth_state["expires"]:
+        with auth_lock:
+            # Whoever gets the lock first refreshes; the others reuse its result.
+            if time.perf_counter() >= auth_state["expires"]:
+                started = time.perf_counter()
+                apply_setup(send_setup(), started)
+    return authorized_copy(spec)
+"""
+
+SESSION_SETUP_ASYNC_BLOCK = """
+auth_lock = []
+
+
+async def authorized_spec(spec):
+    if time.perf_counter() >= auth_state["expires"]:
+        # asyncio locks bind to one event loop and every batch runs in a new one.
+        loop = asyncio.get_running_loop()
+        if not auth_lock or auth_lock[0] is not loop:
+            auth_lock[:] = [loop, asyncio.Lock()]
+        async with auth_lock[1]:
+            if time.perf_counter() >= auth_state["expires"]:
+                started = time.perf_counter()
+                apply_setup(await send_setup(), started)
+    return authorized_copy(spec)
+"""
+
+SETUP_RULE_KINDS = ("json", "css", "xpath", "regex", "cookie", "header")
+
+
+CURL_READ_CHUNK_SIZE = 65536
+CURL_LOOKAHEAD = 16
+
+SHELL_PLAIN_RE = re.compile(r"[^\s'\"\\;&|#$]+")
+SHELL_DOUBLE_RE = re.compile(r'[^"\\]+')
+SHELL_ANSI_RE = re.compile(r"[^'\\]+")
+CMD_WORD_RES = {
+    (False, False): re.compile(r'[^\s"^\\&|]+'),
+    (False, True): re.compile(r'[^"^\\&|\r\n]+'),
+    (True, False): re.compile(r'[^\s"\\]+'),
+    (True, True): re.compile(r'[^"\\]+'),
+}
+# A line that starts a curl command; the parse cache splits captures there.
+CURL_LINE_RE = re.compile(r'^[ \t]*(?:[^\s"\'^]*[\\/])?curl(?:\.exe)?(?=[ \t])', re.M | re.I)
+# A curl word in command position; group 1 is set when the command itself is
+# written for cmd.exe (first argument opens with ^" or the line ends in ^).
+# The trailing ^ only counts outside quotes, so a bash body that continues on
+# the next line is never mistaken for a cmd continuation.
+CMD_CURL_RE = re.compile(r'[ \t\r\n]*(?:[^\s"\'^]*[\\/])?curl(?:\.exe)?(?=[ \t])'
+                         r'([ \t]+\^"|(?:[^\'"\n]|"[^"\n]*"|\'[^\'\n]*\')*\^\r?\n)?', re.I)
+
+ANSI_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v",
+                "e": "\x1b", "E": "\x1b", "\\": "\\", "'": "'", '"': '"', "?": "?"}
+ANSI_HEX_RES = {"x": re.compile(r"[0-9a-fA-F]{1,2}"), "u": re.compile(r"[0-9a-fA-F]{1,4}"),
+                "U": re.compile(r"[0-9a-fA-F]{1,8}")}
+ANSI_OCTAL_RE = re.compile(r"[0-7]{1,3}")
+
+CURL_SHORT_FLAGS = {
+    "X": "--request", "H": "--header", "b": "--cookie", "d": "--data", "F": "--form",
+    "u": "--user", "A": "--user-agent", "e": "--referer", "G": "--get", "I": "--head",
+    "o": "--output", "x": "--proxy", "m": "--max-time", "w": "--write-out", "c": "--cookie-jar",
+    "E": "--cert", "r": "--range", "T": "--upload-file", "U": "--proxy-user", "K": "--config",
+    "C": "--continue-at", "Y": "--speed-limit", "y": "--speed-time", "z": "--time-cond",
+    "t": "--telnet-option", "Q": "--quote", "P": "--ftp-port",
+}
+CURL_VALUE_FLAGS = {
+    "--request", "--header", "--cookie", "--data", "--data-raw", "--data-ascii", "--data-binary",
+    "--data-urlencode", "--json", "--form", "--form-string", "--user", "--user-agent", "--referer",
+    "--url", "--url-query", "--oauth2-bearer", "--output", "--proxy", "--max-time", "--write-out",
+    "--cookie-jar", "--cert", "--range", "--upload-file", "--proxy-user", "--config", "--continue-at",
+    "--speed-limit", "--speed-time", "--time-cond", "--telnet-option", "--quote", "--ftp-port",
+    "--connect-timeout", "--retry", "--retry-delay", "--retry-max-time", "--max-redirs", "--cacert",
+    "--capath", "--key", "--key-type", "--cert-type", "--pass", "--resolve", "--connect-to",
+    "--interface", "--limit-rate", "--proxy-header", "--dns-servers", "--local-port", "--aws-sigv4",
+    "--unix-socket", "--abstract-unix-socket", "--request-target", "--variable", "--noproxy",
+    "--expect100-timeout", "--happy-eyeballs-timeout-ms", "--keepalive-time", "--pinnedpubkey",
+    "--tls-max", "--ciphers", "--curves", "--tls13-ciphers", "--max-filesize", "--output-dir",
+    "--trace", "--trace-ascii", "--stderr", "--dump-header", "--preproxy", "--proxy-cacert",
+    "--socks4", "--socks4a", "--socks5", "--socks5-hostname", "--hostpubmd5", "--hostpubsha256",
+    "--sasl-authzid", "--login-options", "--mail-from", "--mail-rcpt", "--mail-auth",
+}
+CURL_DATA_FLAGS = {"--data", "--data-raw", "--data-ascii", "--data-binary", "--data-urlencode", "--json"}
+CURL_COMMAND_NAMES = {"curl", "curl.exe"}
+
+STORE_FILE = "requests.jsonl"
+STORE_INDEX_FILE = "requests.index.json"
+STORE_VERSION = 1
+STORE_CATEGORIES = ["headers", "cookies", "query_params", "body_params", "form_data", "json_data"]
+
+PARSE_CACHE_FILE = "parse_cache.sqlite"
+# Rows live on disk, so the bound can comfortably exceed the largest capture.
+PARSE_CACHE_SIZE = 200000
+# Bump whenever parse_curl_tokens or the block splitting changes its output so stale entries are dropped.
+PARSE_CACHE_VERSION = 4
+
+
+def read_text_chunks(source, chunk_size=CURL_READ_CHUNK_SIZE):
+    if isinstance(source, str):
+        yield source
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        yield chunk
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class TextCursor:
+    # Look-ahead buffer over text chunks, shared by the bash and cmd word
+    # splitters so the dialect can change from one command to the next.
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        # Set when the input ends inside a quote, so a split capture can be rejoined.
+        self.open_quote = False
+
+    def fill(self, size):
+        while len(self.buf) - self.pos < size and not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+            else:
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+        return len(self.buf) - self.pos
+
+
+def shell_words(cursor):
+    # Yields the bash words of one command, then None where it ends
+    # (newline, ;, &, |).
+    buf, pos = cursor.buf, cursor.pos
+    word = []
+    in_word = False
+    state = None
+    while True:
+        if len(buf) - pos < CURL_LOOKAHEAD and not cursor.eof:
+            cursor.pos = pos
+            cursor.fill(CURL_LOOKAHEAD)
+            buf, pos = cursor.buf, cursor.pos
+            continue
+        if pos >= len(buf):
+            break
+        c = buf[pos]
+
+        if state == "'":
+            end = buf.find("'", pos)
+            if end == -1:
+                word.append(buf[pos:])
+                pos = len(buf)
+            else:
+                word.append(buf[pos:end])
+                pos = end + 1
+                state = None
+        elif state == '"':
+            if c == '"':
+                state = None
+                pos += 1
+            elif c == "\\":
+                nxt = buf[pos + 1:pos + 2]
+                if nxt == "\n":
+                    pos += 2
+                elif nxt in ('"', "\\", "$", "`"):
+                    word.append(nxt)
+                    pos += 2
+                else:
+                    word.append("\\")
+                    pos += 1
+            else:
+                match = SHELL_DOUBLE_RE.match(buf, pos)
+                word.append(match.group())
+                pos = match.end()
+        elif state == "$'":
+            if c == "'":
+                state = None
+                pos += 1
+            elif c == "\\":
+                nxt = buf[pos + 1:pos + 2]
+                if nxt in ANSI_HEX_RES:
+                    digits = ANSI_HEX_RES[nxt].match(buf, pos + 2)
+                    if digits:
+                        word.append(chr(int(digits.group(), 16)))
+                        pos = digits.end()
+                    else:
+                        word.append("\\" + nxt)
+                        pos += 2
+                elif nxt and nxt in "01234567":
+                    digits = ANSI_OCTAL_RE.match(buf, pos + 1)
+                    word.append(chr(int(digits.group(), 8)))
+                    pos = digits.end()
+                else:
+                    word.append(ANSI_ESCAPES.get(nxt, "\\" + nxt))
+                    pos += 1 + len(nxt)
+            else:
+                match = SHELL_ANSI_RE.match(buf, pos)
+                word.append(match.group())
+                pos = match.end()
+        elif state == "#":
+            end = buf.find("\n", pos)
+            pos = len(buf) if end == -1 else end
+            if end != -1:
+                state = None
+        elif c in " \t\r":
+            if in_word:
+                yield "".join(word)
+                word = []
+                in_word = False
+            pos += 1
+        elif c in "\n;&|":
+            if in_word:
+                yield "".join(word)
+            cursor.pos = pos + 1
+            yield None
+            return
+        elif c == "\\":
+            nxt = buf[pos + 1:pos + 2]
+            if nxt == "\n":
+                pos += 2
+            elif nxt == "\r" and buf[pos + 2:pos + 3] == "\n":
+                pos += 3
+            else:
+                word.append(nxt or "\\")
+                in_word = True
+                pos += 1 + len(nxt)
+        elif c == "'" or c == '"':
+            state = c
+            in_word = True
+            pos += 1
+        elif c == "$" and buf[pos + 1:pos + 2] == "'":
+            state = "$'"
+            in_word = True
+            pos += 2
+        elif c == "#" and not in_word:
+            state = "#"
+        else:
+            match = SHELL_PLAIN_RE.match(buf, pos)
+            text = match.group() if match else c
+            word.append(text)
+            in_word = True
+            pos += len(text)
+    cursor.pos = pos
+    cursor.open_quote = state not in (None, "#")
+    if in_word:
+        yield "".join(word)
+
+
+def cmd_words(cursor):
+    # Windows "Copy as cURL (cmd)": cmd.exe strips ^ escapes, then the C runtime
+    # splits arguments on unquoted whitespace, with \" as a literal quote.
+    buf, pos = cursor.buf, cursor.pos
+    word = []
+    in_word = False
+    cmd_quoted = False
+    arg_quoted = False
+    backslashes = 0
+    while True:
+        if len(buf) - pos < CURL_LOOKAHEAD and not cursor.eof:
+            cursor.pos = pos
+            cursor.fill(CURL_LOOKAHEAD)
+            buf, pos = cursor.buf, cursor.pos
+            continue
+        if pos >= len(buf):
+            break
+        c = buf[pos]
+        pos += 1
+        if c == "^" and not cmd_quoted:
+            nxt = buf[pos:pos + 1]
+            if nxt == "\n":
+                pos += 1
+                continue
+            if nxt == "\r" and buf[pos + 1:pos + 2] == "\n":
+                pos += 2
+                continue
+            if not nxt:
+                continue
+            c = nxt
+            pos += 1
+        elif c == '"':
+            cmd_quoted = not cmd_quoted
+        elif not cmd_quoted and (c == "\n" or c == "&" or c == "|"):
+            word.append("\\" * backslashes)
+            if in_word:
+                yield "".join(word)
+            cursor.pos = pos
+            yield None
+            return
+
+        if c == "\\":
+            backslashes += 1
+            in_word = True
+            continue
+        if c == '"':
+            word.append("\\" * (backslashes // 2))
+            in_word = True
+            if backslashes % 2:
+                word.append('"')
+            else:
+                arg_quoted = not arg_quoted
+            backslashes = 0
+            continue
+        if backslashes:
+            word.append("\\" * backslashes)
+            backslashes = 0
+        if c in " \t\r\n" and not arg_quoted:
+            if in_word:
+                yield "".join(word)
+                word = []
+                in_word = False
+            continue
+        word.append(c)
+        match = CMD_WORD_RES[cmd_quoted, arg_quoted].match(buf, pos)
+        if match:
+            word.append(match.group())
+            pos = match.end()
+        in_word = True
+    cursor.pos = pos
+    cursor.open_quote = cmd_quoted
+    word.append("\\" * backslashes)
+    if in_word:
+        yield "".join(word)
+
+
+def iter_shell_words(chunks):
+    # Yields bash words, and None wherever a command ends.
+    cursor = TextCursor(chunks)
+    while cursor.fill(1):
+        yield from shell_words(cursor)
+
+
+def iter_curl_commands(source, chunk_size=CURL_READ_CHUNK_SIZE):
+    # Yields the argument list of every curl command in a str or a text/binary
+    # file, one command at a time. Only a curl word in command position starts a
+    # command, so URLs and bodies mentioning "curl" are left alone.
+    # The dialect is decided per command from how that command is written, so
+    # a caret inside a quoted bash body never switches the parser. Lines that
+    # are not curl commands keep the dialect of the command before them.
+    yield from iter_cursor_commands(TextCursor(read_text_chunks(source, chunk_size)))
+
+
+def iter_cursor_commands(cursor):
+    command = None
+    words = shell_words
+    while cursor.fill(CURL_READ_CHUNK_SIZE):
+        curl_start = CMD_CURL_RE.match(cursor.buf, cursor.pos)
+        if curl_start:
+            words = cmd_words if curl_start.group(1) else shell_words
+        at_start = True
+        for word in words(cursor):
+            if word is None:
+                break
+            if at_start and os.path.basename(word.replace("\\", "/")).lower() in CURL_COMMAND_NAMES:
+                if command:
+                    yield command
+                command = []
+            elif command is not None:
+                command.append(word)
+            at_start = False
+    if command:
+        yield command
+
+
+def iter_curl_options(tokens):
+    # Normalizes curl arguments to (long flag, value) pairs; positional
+    # arguments come back as ("--url", value).
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token.startswith("--") and len(token) > 2:
+            if token in CURL_VALUE_FLAGS:
+                value = tokens[i] if i < len(tokens) else ""
+                i += 1
+                yield token, value
+            else:
+                yield token, None
+        elif token.startswith("-") and len(token) > 1:
+            for pos in range(1, len(token)):
+                flag = CURL_SHORT_FLAGS.get(token[pos])
+                if flag in CURL_VALUE_FLAGS:
+                    value = token[pos + 1:]
+                    if not value:
+                        value = tokens[i] if i < len(tokens) else ""
+                        i += 1
+                    yield flag, value
+                    break
+                yield flag or "-" + token[pos], None
+        else:
+            yield "--url", token
+
+
+def split_cookie_string(value, cookies):
+    for cookie in value.split(";"):
+        if "=" in cookie:
+            c_key, c_val = cookie.strip().split("=", 1)
+            cookies[c_key] = c_val
+
+
+def read_data_file(path, strip_newlines):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = f.read()
+    except OSError:
+        return "@" + path
+    if strip_newlines:
+        data = data.replace("\r", "").replace("\n", "")
+    return data
+
+
+def data_value(flag, value):
+    if flag == "--data-urlencode":
+        name, sep, content = value.partition("=")
+        if not sep:
+            name, sep, path = value.partition("@")
+            content = read_data_file(path, False) if sep else value
+            if not sep:
+                name = ""
+        content = urllib.parse.quote_plus(content)
+        return f"{name}={content}" if name else content
+    if value.startswith("@") and flag in ("--data", "--data-ascii", "--data-binary", "--json"):
+        return read_data_file(value[1:], flag in ("--data", "--data-ascii"))
+    return value
+
+
+def form_value(value):
+    # name=@file[;type=...][;filename=...] stays a reference to the file, which
+    # the generated script maps instead of inlining.
+    if not value.startswith("@"):
+        return value
+    path, *options = value[1:].split(";")
+    reference = {"path": os.path.abspath(path)}
+    for option in options:
+        key, sep, option_value = option.partition("=")
+        if sep and key.strip() in ("type", "filename"):
+            reference[key.strip()] = option_value.strip().strip('"')
+    return reference
+
+
+def reads_data_file(flag, value):
+    # Mirrors data_value: only these forms read a file.
+    if flag == "--data-urlencode":
+        return "=" not in value and "@" in value
+    return value.startswith("@") and flag in ("--data", "--data-ascii", "--data-binary", "--json")
+
+
+def parse_curl_tokens(tokens):
     headers = {}
     cookies = {}
     query_params = {}
     body_params = {}
     json_data = {}
     form_data = {}
-    method = "GET"
+    data_args = []
+    method = None
     url = None
-    method_explicit = False
+    use_get = False
 
-    i = 0
-    while i < len(tokens):
-        token = tokens[i]
-
-        # URL
-        if token.startswith("http"):
-            parsed_url = urllib.parse.urlparse(token)
-            url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-            query_params = dict(urllib.parse.parse_qsl(parsed_url.query))
-
-        # HTTP Method
-        elif token in ['-X', '--request']:
-            method = tokens[i + 1].upper()
-            method_explicit = True
-            i += 1
-
-        # Header
-        elif token == '-H' or token.startswith('-H'):
-            header = token[2:] if token.startswith('-H') and len(token) > 2 else tokens[i + 1]
-            if ':' in header:
-                key, value = map(str.strip, header.split(':', 1))
-                if key.lower() == 'cookie':
-                    for cookie in value.split(';'):
-                        if '=' in cookie:
-                            c_key, c_val = cookie.strip().split('=', 1)
-                            cookies[c_key] = c_val
+    for flag, value in iter_curl_options(tokens):
+        if flag == "--url":
+            if url is None:
+                if "://" not in value:
+                    value = "http://" + value
+                parsed_url = urllib.parse.urlparse(value)
+                url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
+                query_params.update(urllib.parse.parse_qsl(parsed_url.query))
+        elif flag == "--url-query":
+            query_params.update(urllib.parse.parse_qsl(value.lstrip("+")))
+        elif flag == "--request":
+            method = value.upper()
+        elif flag == "--header":
+            if ":" in value:
+                key, val = map(str.strip, value.split(":", 1))
+                if key.lower() == "cookie":
+                    split_cookie_string(val, cookies)
                 else:
-                    headers[key] = value
-            if not token.startswith('-H'):
-                i += 1
-
-        # Cookie
-        elif token in ['-b', '--cookie'] or token.startswith('-b'):
-            cookie_val = token[2:] if token.startswith('-b') and len(token) > 2 else tokens[i + 1]
-            for cookie in cookie_val.split(';'):
-                if '=' in cookie:
-                    c_key, c_val = cookie.strip().split('=', 1)
-                    cookies[c_key] = c_val
-            if not token.startswith('-b'):
-                i += 1
-
-        # Body
-        elif token in ['--data', '--data-raw', '--data-urlencode', '--data-binary', '-d']:
-            data_val = tokens[i + 1]
-            headers_lower = {k.lower(): v for k, v in headers.items()}
-            content_type = headers_lower.get("content-type", "")
-            if not method_explicit:
+                    headers[key] = val
+        elif flag == "--cookie":
+            split_cookie_string(value, cookies)
+        elif flag == "--user":
+            credentials = base64.b64encode(value.encode("utf-8")).decode("ascii")
+            headers.setdefault("Authorization", f"Basic {credentials}")
+        elif flag == "--oauth2-bearer":
+            headers.setdefault("Authorization", f"Bearer {value}")
+        elif flag == "--user-agent":
+            headers.setdefault("User-Agent", value)
+        elif flag == "--referer":
+            headers.setdefault("Referer", value)
+        elif flag in CURL_DATA_FLAGS:
+            data_args.append((flag, value))
+            if flag == "--json":
+                headers.setdefault("Content-Type", "application/json")
+                headers.setdefault("Accept", "application/json")
+        elif flag in ("--form", "--form-string"):
+            if "=" in value:
+                k, v = value.split("=", 1)
+                form_data[k] = form_value(v) if flag == "--form" else v
+            if method is None:
                 method = "POST"
+        elif flag == "--get":
+            use_get = True
+        elif flag == "--head":
+            if method is None:
+                method = "HEAD"
 
+    # Bodies are interpreted once every header is known, so -H after -d still
+    # decides whether the payload is JSON. A body that is exactly one binary
+    # @file is kept as a reference; any other @file is read and inlined.
+    body_file = None
+    inlined_files = False
+    if len(data_args) == 1 and data_args[0][0] in ("--data-binary", "--json") and not use_get \
+            and data_args[0][1].startswith("@") and data_args[0][1] != "@-":
+        body_file = os.path.abspath(data_args[0][1][1:])
+        if method is None:
+            method = "POST"
+    elif data_args:
+        inlined_files = any(reads_data_file(flag, value) for flag, value in data_args)
+        data_val = "&".join(data_value(flag, value) for flag, value in data_args)
+        if use_get:
+            query_params.update(urllib.parse.parse_qsl(data_val))
+        else:
+            if method is None:
+                method = "POST"
+            content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
             try:
                 parsed = json.loads(data_val)
                 if "application/json" in content_type and isinstance(parsed, (dict, list)):
@@ -78,87 +2022,224 @@ def extract_curl(curl_command):
                     body_params.update(urllib.parse.parse_qsl(data_val))
             except json.JSONDecodeError:
                 body_params.update(urllib.parse.parse_qsl(data_val))
-            i += 1
-
-        # Multipart
-        elif token == '-F':
-            form_val = tokens[i + 1]
-            if '=' in form_val:
-                k, v = form_val.split('=', 1)
-                form_data[k] = v
-            if not method_explicit:
-                method = "POST"
-            i += 1
-
-        i += 1
 
     return {
         "url": url,
-        "method": method,
+        "method": method or "GET",
         "headers": headers,
         "cookies": cookies,
         "query_params": query_params,
         "body_params": body_params,
         "json_data": json_data,
-        "form_data": form_data
+        "form_data": form_data,
+        "body_file": body_file,
+        "inlined_files": inlined_files
     }
 
 
-def process_extracted_curls(content, extracted_data_dir="extracted_data"):
-    os.makedirs(extracted_data_dir, exist_ok=True)
+def extract_curl(curl_command):
+    tokens = next(iter_curl_commands(curl_command), None)
+    if tokens is None:
+        tokens = [word for word in iter_shell_words([curl_command]) if word is not None]
+    return parse_curl_tokens(tokens)
+
+
+def iter_capture_blocks(chunks):
+    # Cuts the raw capture before every line that starts a curl command, so
+    # unchanged commands can be looked up by their text without tokenizing.
+    pieces = []
+    line_start = True
+    for chunk in chunks:
+        start = 0
+        for match in CURL_LINE_RE.finditer(chunk):
+            if match.start() == 0 and not line_start:
+                continue
+            pieces.append(chunk[start:match.start()])
+            block = "".join(pieces)
+            if block:
+                yield block
+            pieces = []
+            start = match.start()
+        pieces.append(chunk[start:])
+        line_start = chunk.endswith("\n")
+    block = "".join(pieces)
+    if block:
+        yield block
+
+
+def iter_capture_commands(chunks, lookup=None):
+    # Yields (cache key, cached value, commands) per block. Blocks whose key
+    # lookup() knows are not tokenized at all. A block that ends inside a quote
+    # or on a line continuation did not really end there; it is joined with the next.
+    pending = ""
+    for block in iter_capture_blocks(chunks):
+        text = pending + block
+        key = block_cache_key(text) if lookup else None
+        cached = lookup(key) if lookup else None
+        if cached is not None:
+            pending = ""
+            yield key, cached, []
+            continue
+        cursor = TextCursor([text])
+        commands = list(iter_cursor_commands(cursor))
+        if cursor.open_quote or text.rstrip("\r\n").endswith(("\\", "^")):
+            pending = text
+            continue
+        pending = ""
+        yield key, None, commands
+    if pending:
+        yield block_cache_key(pending) if lookup else None, None, list(iter_curl_commands(pending))
 
-    curl_blocks = re.split(r'\bcurl\b', content)
-    curl_blocks = [f'curl {block.strip()}' for block in curl_blocks if block.strip()]
-
-    categories = {
-        "headers": [],
-        "cookies": [],
-        "query_params": [],
-        "body_params": [],
-        "form_data": [],
-        "json_data": [],
-        "meta": []
+
+def block_cache_key(text):
+    # @file paths are resolved against the working directory, so it is part of the key.
+    key = f"{PARSE_CACHE_VERSION}\0{os.getcwd()}\0{text}"
+    return hashlib.sha256(key.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def open_parse_cache(path):
+    try:
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE IF NOT EXISTS parse_cache (key TEXT PRIMARY KEY, records TEXT, used INTEGER)")
+        db.execute("CREATE INDEX IF NOT EXISTS parse_cache_used ON parse_cache (used)")
+    except sqlite3.Error as e:
+        print("⚠️ Parse cache unavailable:", e)
+        return None
+    return db
+
+
+def update_parse_cache(db, hits, entries, cache_size):
+    # Only touched rows are written; the least recently used ones past
+    # cache_size are dropped.
+    used = time.time_ns()
+    try:
+        with db:
+            db.executemany("UPDATE parse_cache SET used = ? WHERE key = ?", ((used, key) for key in hits))
+            db.executemany("INSERT OR REPLACE INTO parse_cache VALUES (?, ?, ?)",
+                           ((key, records, used) for key, records in entries))
+            db.execute("DELETE FROM parse_cache WHERE key IN (SELECT key FROM parse_cache ORDER BY used DESC "
+                       "LIMIT -1 OFFSET ?)", (cache_size,))
+    except sqlite3.Error as e:
+        print("⚠️ Could not update the parse cache:", e)
+    db.close()
+
+
+def store_record(result):
+    headers = result.get("headers", {})
+    content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+    json_body = result.get("json_data", {})
+    body = result.get("body_params", {})
+    return {
+        "method": result.get("method", ""),
+        "url": result.get("url", ""),
+        "headers": headers,
+        "cookies": result.get("cookies", {}),
+        "query_params": result.get("query_params", {}),
+        "body_params": body if not isinstance(body, dict) or any(
+            isinstance(v, str) for v in body.values()) else {},
+        "form_data": result.get("form_data", {}),
+        "json_data": json_body if "application/json" in content_type and isinstance(json_body, dict) else {},
+        "body_file": result.get("body_file"),
     }
 
-    for idx, curl_cmd in enumerate(curl_blocks, 1):
-        try:
-            result = extract_curl(curl_cmd)
-            for key in categories.keys():
-                if key == "meta":
-                    categories[key].append({
-                        "method": result.get("method", ""),
-                        "url": result.get("url", "")
-                    })
-                elif key == "json_data":
-                    headers = result.get("headers", {})
-                    headers_lower = {k.lower(): v for k, v in headers.items()}
-                    content_type = headers_lower.get("content-type", "")
-                    body = result.get("json_data", {})
-                    if "application/json" in content_type and isinstance(body, dict):
-                        categories[key].append(body)
-                    else:
-                        categories[key].append({})
-                elif key == "body_params":
-                    body = result.get("body_params", {})
-                    fallback_data = body if not isinstance(body, dict) or any(
-                        isinstance(v, str) for v in body.values()) else {}
-                    categories[key].append(fallback_data)
-                else:
-                    categories[key].append(result.get(key, {}))
-            print(f"[✓]  Parsed curl #{idx}")
-        except Exception as e:
-            print(f"[X] Error parsing curl #{idx}:", e)
 
-    saved_data = {}
-    for key, data in categories.items():
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{extracted_data_dir}/{key}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        saved_data[key] = data
+def encode_store_record(result):
+    record = store_record(result)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n", record["method"], record["url"]
 
-    print("✅ All JSON files saved.")
-    return saved_data
+
+def write_extraction_store(results, extracted_data_dir="extracted_data"):
+    # One JSON line per request plus an index of byte offsets and the
+    # method/url pairs, so readers can list requests and seek to single ones.
+    # Items are parse results or already encoded (line, method, url) tuples.
+    os.makedirs(extracted_data_dir, exist_ok=True)
+    store_path = os.path.join(extracted_data_dir, STORE_FILE)
+    index_path = os.path.join(extracted_data_dir, STORE_INDEX_FILE)
+    index = {"version": STORE_VERSION, "offsets": [], "meta": []}
+    offset = 0
+    with open(store_path + ".tmp", "wb") as f:
+        for result in results:
+            line, method, url = result if isinstance(result, tuple) else encode_store_record(result)
+            line = line.encode("utf-8")
+            f.write(line)
+            index["offsets"].append(offset)
+            index["meta"].append({"method": method, "url": url})
+            offset += len(line)
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        # dumps() runs in the C encoder; dump() would iterate in Python.
+        f.write(json.dumps(index, ensure_ascii=False, separators=(",", ":")))
+    os.replace(store_path + ".tmp", store_path)
+    os.replace(index_path + ".tmp", index_path)
+    return index
+
+
+def load_store_index(extracted_data_dir="extracted_data"):
+    try:
+        with open(os.path.join(extracted_data_dir, STORE_INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {"version": STORE_VERSION, "offsets": [], "meta": []}
+    if index.get("version") != STORE_VERSION:
+        raise ValueError(f"Unsupported extraction store version: {index.get('version')}")
+    return index
+
+
+def read_store_records(extracted_data_dir, request_ids, index=None):
+    if index is None:
+        index = load_store_index(extracted_data_dir)
+    offsets = index["offsets"]
+    with open(os.path.join(extracted_data_dir, STORE_FILE), "rb") as f:
+        for request_id in request_ids:
+            f.seek(offsets[request_id])
+            yield json.loads(f.readline())
+
+
+def process_extracted_curls(content, extracted_data_dir="extracted_data", cache_size=PARSE_CACHE_SIZE):
+    os.makedirs(extracted_data_dir, exist_ok=True)
+    db = open_parse_cache(os.path.join(extracted_data_dir, PARSE_CACHE_FILE)) if cache_size else None
+    hits = []
+    entries = []
+
+    def lookup(key):
+        row = db.execute("SELECT records FROM parse_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def parsed_results():
+        idx = 0
+        for key, cached, commands in iter_capture_commands(read_text_chunks(content), lookup if db else None):
+            if cached is not None:
+                hits.append(key)
+                for encoded in json.loads(cached):
+                    idx += 1
+                    print(f"[✓]  Parsed curl #{idx}")
+                    yield tuple(encoded)
+                continue
+            encoded_block = []
+            cacheable = True
+            for tokens in commands:
+                idx += 1
+                try:
+                    result = parse_curl_tokens(tokens)
+                    print(f"[✓]  Parsed curl #{idx}")
+                except Exception as e:
+                    print(f"[X] Error parsing curl #{idx}:", e)
+                    cacheable = False
+                    continue
+                # Bodies inlined from @files are re-read next time; the file may have changed.
+                cacheable = cacheable and not result["inlined_files"]
+                encoded = encode_store_record(result)
+                encoded_block.append(encoded)
+                yield encoded
+            if db and cacheable and encoded_block:
+                entries.append((key, json.dumps(encoded_block, ensure_ascii=False)))
+
+    index = write_extraction_store(parsed_results(), extracted_data_dir)
+
+    if db:
+        update_parse_cache(db, hits, entries, cache_size)
+        print(f"♻️ Reused {len(hits)} cached capture blocks.")
+    print(f"✅ Saved {len(index['meta'])} requests to {os.path.join(extracted_data_dir, STORE_FILE)}.")
+    return index
 
 
 def get_latest_file(directory, prefix):
@@ -170,157 +2251,781 @@ def get_latest_file(directory, prefix):
     return latest_file
 
 
+def build_request_executor(engine, use_sessions, stream_search, phase_timings, prepare_requests=False,
+                           background_saves=False, progress_metrics=False, adaptive_concurrency=False,
+                           retries=False, circuit_breaker=False, uploads=False, cassette=False, session_setup=False):
+    # One generic executor serves every request spec; per-request behaviour
+    # (backend, body type, proxy, search patterns) is read from the spec.
+    is_async = engine == "async"
+    await_prefix = "await " if is_async else ""
+    if is_async:
+        http_client = "await async_session"
+    elif use_sessions:
+        http_client = "get_session(spec['backend'])"
+    else:
+        http_client = "http_modules[spec['backend']]"
+
+    code = []
+    code.append("")
+    code.append("def prepare_spec(spec):")
+    code.append("    # Call arguments are built once per spec and shared by every iteration.")
+    code.append("    headers = spec['headers']")
+    code.append("    if spec['json'] is not None:")
+    code.append("        headers = {k: v for k, v in headers.items() if k != 'content-type'}")
+    if uploads:
+        code.append("    kwargs = {'params': spec['params'], 'headers': headers, 'cookies': spec['cookies'], 'files': {}}")
+        code.append("    spec['upload_error'] = None")
+        code.append("    if spec['body_file'] or spec['files']:")
+        code.append("        try:")
+        code.append("            kwargs['headers'], kwargs['data'] = upload_body(spec, headers)")
+        code.append("        except OSError as e:")
+        code.append("            # Every iteration of this request fails instead of the whole script.")
+        code.append("            spec['upload_error'] = f'Cannot read upload for {spec[\"name\"]}: {e}'")
+        code.append("            print(spec['upload_error'])")
+        code.append("    elif spec['json'] is not None:")
+    else:
+        code.append("    kwargs = {'params': spec['params'], 'headers': headers, 'cookies': spec['cookies'], 'files': spec['files']}")
+        code.append("    if spec['json'] is not None:")
+    code.append("        kwargs['json'] = spec['json']")
+    code.append("    else:")
+    code.append("        kwargs['data'] = spec['data']")
+    code.append("    if spec['proxy']:")
+    code.append("        kwargs['proxies'] = proxies")
+    code.append("        kwargs['verify'] = False")
+    code.append("    if spec['backend'] == 'curl_cffi':")
+    code.append("        kwargs['impersonate'] = 'chrome99'")
+    if stream_search:
+        code.append("    spec['matcher'] = compile_patterns(spec['search']) if spec['search'] else None")
+    else:
+        code.append("    spec['matcher'] = None")
+    code.append("    if spec['matcher']:")
+    code.append("        kwargs['stream'] = True")
+    code.append("    spec['send_url'] = spec['url']")
+    code.append("    spec['prepared'] = None")
+    if prepare_requests:
+        code.append("    prepare_template(spec, kwargs)")
+    code.append("    spec['kwargs'] = kwargs")
+    code.append("")
+    code.append("")
+    if not background_saves:
+        code.append("def save_response(spec, response, body=None):")
+        code.append("    content_type = response.headers.get('Content-Type', '')")
+        code.append("    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')")
+        code.append("    file_prefix = f\"{response_dir}/response_{spec['domain']}_{timestamp}_{spec['idx']}\"")
+        code.append("    if body is not None:")
+        code.append("        # Raw bytes as received; the body may stop at the match when close_on_match is set.")
+        code.append("        if 'application/json' in content_type:")
+        code.append("            ext = '.json'")
+        code.append("        elif 'text/html' in content_type:")
+        code.append("            ext = '.html'")
+        code.append("        else:")
+        code.append("            ext = '.txt'")
+        code.append("        with open(file_prefix + ext, 'wb') as f:")
+        code.append("            f.write(body)")
+        code.append("    elif 'application/json' in content_type:")
+        code.append("        with open(file_prefix + '.json', 'w', encoding='utf-8') as f:")
+        code.append("            json.dump(response.json(), f, ensure_ascii=False, indent=4)")
+        code.append("    elif 'text/html' in content_type:")
+        code.append("        with open(file_prefix + '.html', 'w', encoding='utf-8') as f:")
+        code.append("            f.write(response.text)")
+        code.append("    else:")
+        code.append("        with open(file_prefix + '.txt', 'w', encoding='utf-8') as f:")
+        code.append("            f.write(response.text)")
+        code.append("")
+        code.append("")
+    send_lines = []
+    if prepare_requests and not is_async:
+        send_lines.append("if spec['prepared'] is not None:")
+        send_lines.append("    response = get_session('requests').send(prepared_request(spec), **kwargs)")
+        send_lines.append("else:")
+        send_lines.append(f"    response = {http_client}.request(spec['method'], spec['send_url'], **kwargs)")
+    else:
+        send_lines.append(f"response = {http_client}.request(spec['method'], spec['send_url'], **kwargs)")
+    if cassette:
+        record_call = "await record_response_async" if is_async else "record_response"
+        send_lines = ["if cassette_mode == 'replay':", "    response = replay_response(spec)", "else:"] + \
+            ["    " + line for line in send_lines] + \
+            ["    if cassette_mode == 'record':", f"        response = {record_call}(spec, response, kwargs)"]
+    if retries:
+        code.append(f"{'async def' if is_async else 'def'} send_once(spec, kwargs):")
+        code.extend("    " + line for line in send_lines)
+        code.append("    return response")
+        code.append("")
+        code.append("")
+        code.append(f"send_retrying = retry_policy({'AsyncRetrying' if is_async else 'Retrying'})")
+        code.append("")
+        code.append("")
+        send_lines = [f"response = {await_prefix}send_retrying(send_once, spec, kwargs)"]
+    # Breaker state lives on the request's own spec, not on its authorized copies.
+    breaker_spec = "template" if session_setup else "spec"
+    if session_setup:
+        code.append(f"{'async def' if is_async else 'def'} send_setup():")
+        code.append("    spec = setup_spec")
+        code.append("    kwargs = spec['kwargs']")
+        code.extend("    " + line for line in send_lines)
+        code.append("    return response")
+        code.append("")
+        code.append("")
+    code.append(f"{'async def' if is_async else 'def'} execute_request(spec, iteration=None, scheduled_at=None):")
+    code.append("    start_time = scheduled_at if scheduled_at is not None else time.perf_counter()")
+    code.append("    url = spec['url']")
+    if session_setup:
+        code.append("    template = spec")
+    else:
+        code.append("    kwargs = spec['kwargs']")
+    code.append("    matcher = spec['matcher']")
+    if circuit_breaker:
+        code.append(f"    if not breaker_allows({breaker_spec}):")
+        code.append("        print(f'Iteration: {iteration} Skipped, circuit open for {spec[\"name\"]}')")
+        if progress_metrics:
+            code.append("        record_progress(None, None)")
+        code.append("        record_result({**dict.fromkeys(result_columns), 'url': url, 'request': spec['name'],")
+        code.append("                       'status': 'Circuit open', 'text_matched': 'No'})")
+        code.append("        return")
+    code.append("    try:")
+    if session_setup:
+        code.append(f"        spec = {await_prefix}authorized_spec(template)")
+        code.append("        kwargs = spec['kwargs']")
+    if uploads:
+        code.append("        if spec['upload_error']:")
+        code.append("            raise OSError(spec['upload_error'])")
+    code.append("        sent_at = time.perf_counter()")
+    code.extend("        " + line for line in send_lines)
+    if session_setup:
+        code.append("        if response.status_code == AUTH_STATUS:")
+        code.append("            # The shared session went stale: refresh it once and resend.")
+        code.append(f"            {'await response.aclose()' if is_async else 'response.close()'}")
+        code.append("            expire_auth(spec)")
+        code.append(f"            spec = {await_prefix}authorized_spec(template)")
+        code.append("            kwargs = spec['kwargs']")
+        code.extend("            " + line for line in send_lines)
+    code.append("        matched_text = body = None")
+    code.append("        if matcher:")
+    code.append(f"            matched_text, body = {await_prefix}search_stream(response, matcher)")
+    code.append("        end_time = time.perf_counter()")
+    code.append("        if matcher:")
+    code.append("            matched = 'Yes' if matched_text is not None else 'No'")
+    code.append("        else:")
+    code.append("            matched = 'Yes' if any(text in response.text for text in spec['search']) else 'No'")
+    code.append("        elapsed = round(end_time - start_time, 2)")
+    code.append("        record_latency(spec['name'], end_time - start_time,")
+    code.append("                       end_time - sent_at if scheduled_at is not None else None)")
+    if phase_timings:
+        code.append("        timings = phase_timings(response, end_time - sent_at)")
+    code.append("        status = 'Success' if response.status_code == 200 else 'Failed'")
+    if adaptive_concurrency or circuit_breaker:
+        code.append("        healthy = response.status_code < 500 and response.status_code != 429")
+    if adaptive_concurrency:
+        code.append("        concurrency_limit.on_result(end_time - sent_at, healthy)")
+    if circuit_breaker:
+        code.append(f"        record_breaker({breaker_spec}, healthy)")
+    if progress_metrics:
+        code.append("        record_progress(response.status_code, end_time - start_time)")
+    code.append(
+        "        print(f'Iteration: {iteration} Status: {response.status_code}, Matched: {matched}, Result: {status}')")
+    code.append("        record_result({")
+    code.append("            'url': url,")
+    code.append("            'request': spec['name'],")
+    code.append("            'status_code': response.status_code,")
+    code.append("            'status': status,")
+    code.append("            'time_taken': elapsed,")
+    code.append("            'latency_ms': (end_time - start_time) * 1000,")
+    code.append("            'queue_ms': (sent_at - start_time) * 1000,")
+    if phase_timings:
+        code.append("            **timings,")
+    code.append("            'text_matched': matched")
+    code.append("        })")
+    code.append("        if response.status_code == 200 and matched == 'Yes':")
+    if background_saves and is_async:
+        code.append("            await save_response_async(spec, response, body)")
+    else:
+        code.append("            save_response(spec, response, body)")
+    code.append("    except Exception as e:")
+    code.append("        failed_after = time.perf_counter() - start_time")
+    code.append("        record_latency(spec['name'], failed_after, error=True)")
+    if adaptive_concurrency:
+        code.append("        concurrency_limit.on_result(None, False)")
+    if circuit_breaker:
+        code.append(f"        record_breaker({breaker_spec}, False)")
+    if progress_metrics:
+        code.append("        record_progress(None, failed_after)")
+    code.append("        print(f'Iteration: {iteration} Request failed with error: {e}')")
+    return "\n".join(code)
+
+
 def generate_requests_from_json(
-        headers_file, cookies_file, query_params_file, body_params_file,
-        form_data_file, json_data_file, meta_file, output_file,
+        extracted_data_dir, output_file,
         include_requests, use_cookies_list, use_proxy_list,
         use_curl_cffi_list, search_texts, total_runs=1, threads=5,
         report_filename="report.xlsx",  response_dir="saved_pages",
-        proxy_url=""):
+        proxy_url="", use_sessions=False, pool_size=10, keep_alive=True,
+        engine="threads", processes=1, results_format=None, render_excel=True,
+        results_batch_size=1000, stream_search=False, close_on_match=True,
+        search_byte_limit=0, load_mode="closed", target_rps=10, rate_profile="constant",
+        profile_seconds=60, phase_timings=False, script_layout="functions",
+        spec_storage="embedded", prepare_requests=False, background_saves=False,
+        save_compression=None, metrics_file=None, metrics_interval=1.0, adaptive_concurrency=False,
+        max_retries=0, retry_backoff=0.5, retry_backoff_max=30.0, breaker_threshold=0, breaker_cooldown=30.0,
+        distributed=False, lease_size=500, report_interval=1.0, cassette=False,
+        setup_request=None, setup_extract=None, setup_ttl=300.0):
 
+    if engine not in ("threads", "async"):
+        raise ValueError(f"Unknown execution engine: {engine}")
+    if processes < 1:
+        raise ValueError("processes must be at least 1")
+    if results_format not in (None, "parquet", "csv", "jsonl"):
+        raise ValueError(f"Unknown results format: {results_format}")
+    if load_mode not in ("closed", "open"):
+        raise ValueError(f"Unknown load mode: {load_mode}")
+    if rate_profile not in ("constant", "ramp", "step", "spike"):
+        raise ValueError(f"Unknown rate profile: {rate_profile}")
+    if script_layout not in ("functions", "table"):
+        raise ValueError(f"Unknown script layout: {script_layout}")
+    if spec_storage not in ("embedded", "sidecar"):
+        raise ValueError(f"Unknown spec storage: {spec_storage}")
+    if save_compression not in (None, "gzip", "zstd"):
+        raise ValueError(f"Unknown save compression: {save_compression}")
+    if adaptive_concurrency and load_mode == "open":
+        raise ValueError("Adaptive concurrency only applies to the closed load model")
+    if max_retries < 0 or breaker_threshold < 0:
+        raise ValueError("max_retries and breaker_threshold must not be negative")
+    if distributed and (lease_size < 1 or report_interval <= 0):
+        raise ValueError("lease_size and report_interval must be positive")
+    setup_extract = setup_extract or {}
+    if setup_request is not None:
+        if not 0 <= setup_request < len(include_requests):
+            raise ValueError(f"setup_request {setup_request} is not an extracted request")
+        if setup_ttl < 0:
+            raise ValueError("setup_ttl must not be negative")
+        for name, rule in setup_extract.items():
+            if not re.fullmatch(r"\w+", name) or rule.partition(":")[0] not in SETUP_RULE_KINDS:
+                raise ValueError(f"Invalid setup extraction {name}={rule!r}; "
+                                 f"expected one of {', '.join(SETUP_RULE_KINDS)} followed by ':'")
 
-    os.makedirs(response_dir, exist_ok=True)
+    if (phase_timings or prepare_requests) and engine == "threads":
+        # libcurl timers are read from the session that sent the request, and
+        # prepared requests are sent through Session.send.
+        use_sessions = True
 
-    with open(headers_file, "r", encoding="utf-8") as f:
-        headers_list = json.load(f)
-    with open(cookies_file, "r", encoding="utf-8") as f:
-        cookies_list = json.load(f)
-    with open(query_params_file, "r", encoding="utf-8") as f:
-        query_params_list = json.load(f)
-    with open(body_params_file, "r", encoding="utf-8") as f:
-        body_params_list = json.load(f)
-    with open(form_data_file, "r", encoding="utf-8") as f:
-        form_data_list = json.load(f)
-    with open(json_data_file, "r", encoding="utf-8") as f:
-        json_data_list = json.load(f)
-    with open(meta_file, "r", encoding="utf-8") as f:
-        meta_list = json.load(f)
+    result_fields = list(RESULT_FIELDS)
+    if phase_timings:
+        position = [name for name, _ in result_fields].index("time_taken") + 1
+        result_fields[position:position] = PHASE_FIELDS
+
+    os.makedirs(response_dir, exist_ok=True)
 
     script_lines = [
+        "import functools",
         "import json",
+        "import os",
         "import urllib.parse",
         "from datetime import datetime",
-        "from concurrent.futures import ThreadPoolExecutor, as_completed",
+        "from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor",
         "import time",
         "import pandas as pd\n",
         "requests_list = []",
         "results = []\n"
     ]
 
-    for idx, meta in enumerate(meta_list):
-        if not include_requests[idx]:
-            continue
+    curl_infos = "None"
+    if phase_timings:
+        script_lines.append(PHASE_TIMINGS_BLOCK)
+        curl_infos = "PHASE_INFOS"
 
-        method = meta["method"].lower()
-        url = meta["url"]
-        use_cookies = use_cookies_list[idx]
-        use_proxy = use_proxy_list[idx]
-        use_curl_cffi = use_curl_cffi_list[idx]
-        search_text = search_texts[idx]
+    if engine == "async":
+        # A single AsyncSession multiplexes every in-flight request; the
+        # "threads" setting becomes the concurrency limit.
+        script_lines.insert(0, "import asyncio")
+        script_lines.insert(0, "from curl_cffi.requests import AsyncSession")
+        script_lines.append("async_session = None")
+        script_lines.append(f"session_curl_infos = {curl_infos}\n")
+    elif use_sessions:
+        # One session per worker thread and backend, so every thread keeps
+        # its connections (and TLS sessions) alive across iterations.
+        session_block = f"""
+import threading
+from requests.adapters import HTTPAdapter
+from curl_cffi import CurlOpt
+
+thread_local = threading.local()
+pool_size = {int(pool_size)}
+keep_alive = {bool(keep_alive)}
 
-        import_line = "from curl_cffi import requests" if use_curl_cffi else "import requests"
-        impersonate_line = ", impersonate='chrome99'" if use_curl_cffi else ""
 
+def get_session(backend):
+    sessions = getattr(thread_local, "sessions", None)
+    if sessions is None:
+        sessions = thread_local.sessions = {{}}
+    session = sessions.get(backend)
+    if session is None:
+        if backend == "curl_cffi":
+            session = cffi_requests.Session(
+                impersonate="chrome99",
+                curl_options={{CurlOpt.MAXCONNECTS: pool_size, CurlOpt.TCP_KEEPALIVE: int(keep_alive)}},
+                curl_infos={curl_infos}
+            )
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        sessions[backend] = session
+    return session
+"""
+        script_lines.append(session_block)
+        for import_line in ("import requests", "from curl_cffi import requests as cffi_requests"):
+            script_lines.insert(0, import_line)
+
+    if stream_search:
+        script_lines.append(f"""
+close_on_match = {bool(close_on_match)}
+search_byte_limit = {int(search_byte_limit)}""")
+        script_lines.append(STREAM_SEARCH_BLOCK)
+        script_lines.append(STREAM_SEARCH_ASYNC_BLOCK if engine == "async" else STREAM_SEARCH_SYNC_BLOCK)
+
+    def request_spec(idx, record, name, search_patterns):
+        url = record["url"]
+        backend = "curl_cffi" if use_curl_cffi_list[idx] else "requests"
+        import_line = "from curl_cffi import requests as cffi_requests" if backend == "curl_cffi" else "import requests"
         if import_line not in script_lines:
             script_lines.insert(0, import_line)
 
-        headers = headers_list[idx]
-        cookies = cookies_list[idx] if use_cookies else {}
-        params = query_params_list[idx]
-        body_data = body_params_list[idx]
-        files = form_data_list[idx]
-        json_data = json_data_list[idx]
-        domain = urllib.parse.urlparse(url).netloc.replace('.', '_')
-
-        req_code = []
-        req_code.append(f"def request_{idx}(iteration=None):")
-        req_code.append(f"    url = {json.dumps(url)}")
-        req_code.append(f"    params = {params}")
-        req_code.append(f"    headers = {headers}" if headers else "    headers = {}")
-        req_code.append(f"    cookies = {cookies}" if cookies else "    cookies = {}")
-        req_code.append(f"    files = {files}")
-        req_code.append(f"    text_to_search = {json.dumps(search_text)}")
-
-        if use_proxy and proxy_url:
-            req_code.append(f"    proxy_url = {json.dumps(proxy_url)}")
-            req_code.append("    proxies = {\"http\": proxy_url, \"https\": proxy_url}")
-
-        req_code.append("    start_time = time.time()")
-
-        request_args = "url, params=params, headers=headers, cookies=cookies"
-        if json_data:
-            req_code.append(f"    data = {json.dumps(json_data)}")
-            req_code.append("    headers.pop('content-type', None)")
-            request_args += ", json=data"
+        return {
+            "idx": idx,
+            "name": name,
+            "method": record["method"].upper(),
+            "url": url,
+            "domain": urllib.parse.urlparse(url).netloc.replace('.', '_'),
+            "backend": backend,
+            "proxy": bool(use_proxy_list[idx] and proxy_url),
+            "params": record["query_params"],
+            "headers": record["headers"],
+            "cookies": record["cookies"] if use_cookies_list[idx] else {},
+            "files": record["form_data"],
+            "data": record["body_params"],
+            "json": record["json_data"] or None,
+            "body_file": record.get("body_file"),
+            "search": search_patterns,
+        }
+
+    # The setup request runs once per worker process, not as part of the load.
+    included = [idx for idx, include in enumerate(include_requests) if include and idx != setup_request]
+    specs = []
+    for idx, record in zip(included, read_store_records(extracted_data_dir, included)):
+        search_text = search_texts[idx]
+        if isinstance(search_text, str):
+            search_patterns = [search_text] if search_text else []
         else:
-            req_code.append(f"    data = {body_data}")
-            request_args += ", data=data"
-
-        request_args += ", files=files"
-        if use_proxy and proxy_url:
-            request_args += ", proxies=proxies, verify=False"
-        request_args += impersonate_line
-
-        req_code.append("    try:")
-        req_code.append(f"        response = requests.{method}({request_args})")
-        req_code.append("        end_time = time.time()")
-        req_code.append("        elapsed = round(end_time - start_time, 2)")
-        req_code.append("        matched = 'Yes' if text_to_search and text_to_search in response.text else 'No'")
-        req_code.append("        status = 'Success' if response.status_code == 200 else 'Failed'")
-        req_code.append(
-            "        print(f'Iteration: {iteration} Status: {response.status_code}, Matched: {matched}, Result: {status}')")
-
-        req_code.append("        results.append({")
-        req_code.append("            'url': url,")
-        req_code.append("            'status_code': response.status_code,")
-        req_code.append("            'status': status,")
-        req_code.append("            'time_taken': elapsed,")
-        req_code.append("            'text_matched': matched")
-        req_code.append("        })")
-
-        req_code.append("        if response.status_code == 200 and matched == 'Yes':")
-        req_code.append("            content_type = response.headers.get('Content-Type', '')")
-        req_code.append("            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')")
-        req_code.append(f"            file_prefix = '{response_dir}/response_{domain}_' + timestamp + '_{idx}'")
-        req_code.append("            if 'application/json' in content_type:")
-        req_code.append("                with open(file_prefix + '.json', 'w', encoding='utf-8') as f:")
-        req_code.append("                    json.dump(response.json(), f, ensure_ascii=False, indent=4)")
-        req_code.append("            elif 'text/html' in content_type:")
-        req_code.append("                with open(file_prefix + '.html', 'w', encoding='utf-8') as f:")
-        req_code.append("                    f.write(response.text)")
-        req_code.append("            else:")
-        req_code.append("                with open(file_prefix + '.txt', 'w', encoding='utf-8') as f:")
-        req_code.append("                    f.write(response.text)")
-        req_code.append("    except Exception as e:")
-        req_code.append("        print(f'Iteration: {iteration} Request failed with error: {e}')")
-
-        script_lines.extend(req_code)
-        script_lines.append(f"requests_list.append(request_{idx})")
+            search_patterns = [text for text in search_text if text]
+        specs.append(request_spec(idx, record, f"request_{idx}", search_patterns))
+    setup_spec = None
+    if setup_request is not None:
+        setup_record = next(read_store_records(extracted_data_dir, [setup_request]))
+        setup_spec = request_spec(setup_request, setup_record, "session_setup", [])
+    sent_specs = specs + [setup_spec] if setup_spec else specs
 
-    main_block = f"""
+    script_lines.append(f"response_dir = {json.dumps(response_dir)}")
+    if proxy_url:
+        script_lines.append(f"proxies = {{'http': {json.dumps(proxy_url)}, 'https': {json.dumps(proxy_url)}}}")
+    if engine == "threads" and not use_sessions:
+        modules = [f"'{backend}': {module}" for backend, module in (("requests", "requests"), ("curl_cffi", "cffi_requests"))
+                   if any(spec["backend"] == backend for spec in sent_specs)]
+        script_lines.append(f"http_modules = {{{', '.join(modules)}}}")
+    if prepare_requests:
+        script_lines.append(f"prepare_with_requests = {engine == 'threads'}")
+        script_lines.append(PREPARED_TEMPLATE_BLOCK)
+    if background_saves:
+        script_lines.append(f"save_compression = {save_compression!r}")
+        script_lines.append(BACKGROUND_SAVE_BLOCK)
+    uploads = any(spec["body_file"] or spec["files"] for spec in sent_specs)
+    if uploads:
+        script_lines.append(f"upload_from_mapping = {engine == 'threads'}")
+        script_lines.append(UPLOAD_BODY_BLOCK)
+    if max_retries or breaker_threshold:
+        script_lines.append(f"""
+max_retries = {int(max_retries)}
+retry_backoff = {float(retry_backoff)}
+retry_backoff_max = {float(retry_backoff_max)}
+breaker_threshold = {int(breaker_threshold)}
+breaker_cooldown = {float(breaker_cooldown)}""")
+        script_lines.append(RESILIENCE_BLOCK)
+    if setup_spec:
+        setup_kinds = {rule.partition(":")[0] for rule in setup_extract.values()}
+        if "json" in setup_kinds:
+            script_lines.insert(0, "import jmespath")
+        if setup_kinds & {"css", "xpath"}:
+            script_lines.insert(0, "import parsel")
+        script_lines.append(f"""
+setup_extract = {setup_extract!r}
+setup_ttl = {float(setup_ttl)}""")
+        script_lines.append(SESSION_SETUP_BLOCK)
+        script_lines.append(SESSION_SETUP_ASYNC_BLOCK if engine == "async" else SESSION_SETUP_SYNC_BLOCK)
+    script_lines.append(build_request_executor(
+        engine, use_sessions, stream_search, phase_timings, prepare_requests, background_saves,
+        bool(metrics_file or distributed), adaptive_concurrency, bool(max_retries), bool(breaker_threshold), uploads,
+        cassette, bool(setup_spec)
+    ))
+    if setup_spec:
+        setup_lines = "".join(f"\n    {key!r}: {value!r}," for key, value in setup_spec.items())
+        script_lines.append(f"""
+setup_spec = {{{setup_lines}
+}}
+prepare_spec(setup_spec)
+""")
 
-if __name__ == "__main__":
-    total_runs = {total_runs}
-    threads = {threads}
-    report_filename = {json.dumps(report_filename)}
+    if script_layout == "functions":
+        for spec in specs:
+            spec_lines = "".join(f"\n    {key!r}: {value!r}," for key, value in spec.items())
+            script_lines.append(f"""
+request_{spec['idx']}_spec = {{{spec_lines}
+}}
+
+
+def request_{spec['idx']}(iteration=None, scheduled_at=None):
+    return execute_request(request_{spec['idx']}_spec, iteration, scheduled_at)
+
+
+prepare_spec(request_{spec['idx']}_spec)
+requests_list.append(request_{spec['idx']})
+""")
+    else:
+        specs_json = json.dumps(specs, ensure_ascii=False, separators=(",", ":"))
+        if spec_storage == "sidecar":
+            specs_file = f"{os.path.splitext(output_file)[0]}.specs.json"
+            with open(specs_file, "w", encoding="utf-8") as f:
+                f.write(specs_json)
+            script_lines.append(f"""
+specs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), {json.dumps(os.path.basename(specs_file))})
+with open(specs_path, "r", encoding="utf-8") as f:
+    request_specs = json.load(f)""")
+        else:
+            script_lines.append(f"request_specs = json.loads({specs_json!r})")
+        script_lines.append("""
+for spec in request_specs:
+    prepare_spec(spec)
+    requests_list.append(functools.partial(execute_request, spec))
+""")
+
+    if engine == "async" and load_mode == "open":
+        runner_block = """
+async def run_requests(expanded_requests):
+    global async_session
+    semaphore = asyncio.Semaphore(threads)
+    pending = set()
 
-    expanded_requests = []
-    for i in range(total_runs):
-        for req in requests_list:
-            expanded_requests.append((req, i + 1))
+    async def run_one(req, iter_num, due):
+        try:
+            async with semaphore:
+                await req(iter_num, due)
+        except Exception as e:
+            print(f"Error in task: {e}")
 
+    bucket = TokenBucket()
+    async with AsyncSession(max_clients=threads, curl_infos=session_curl_infos) as session:
+        async_session = session
+        for req, iter_num in expanded_requests:
+            due = bucket.take()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(run_one(req, iter_num, due))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+"""
+    elif engine == "async":
+        # With adaptive concurrency the AIMD limit replaces the fixed semaphore;
+        # "threads" stays the upper bound.
+        limit_setup = "" if adaptive_concurrency else "\n    semaphore = asyncio.Semaphore(threads)"
+        limit_release = "concurrency_limit.release()" if adaptive_concurrency else "semaphore.release()"
+        limit_acquire = "concurrency_limit.acquire_async()" if adaptive_concurrency else "semaphore.acquire()"
+        limit_summary = "\n    print(f\"Adaptive concurrency settled at {concurrency_limit.limit:.1f} in-flight requests\")" \
+            if adaptive_concurrency else ""
+        runner_block = f"""
+async def run_requests(expanded_requests):
+    global async_session{limit_setup}
+    pending = set()
+
+    async def run_one(req, iter_num):
+        try:
+            await req(iter_num)
+        except Exception as e:
+            print(f"Error in task: {{e}}")
+        finally:
+            {limit_release}
+
+    async with AsyncSession(max_clients=threads, curl_infos=session_curl_infos) as session:
+        async_session = session
+        for req, iter_num in expanded_requests:
+            await {limit_acquire}
+            task = asyncio.create_task(run_one(req, iter_num))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending){limit_summary}
+"""
+    elif load_mode == "open":
+        runner_block = """
+def run_requests(expanded_requests):
+    bucket = TokenBucket()
     with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = {{
-            executor.submit(req, iter_num): i for i, (req, iter_num) in enumerate(expanded_requests)
-        }}
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except Exception as e:
-                print(f"Error in thread: {{e}}")
+        for req, iter_num in expanded_requests:
+            due = bucket.take()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Waiting for a slot does not hide overload: latency still counts from the due time.
+            submit_slots.acquire()
+            executor.submit(req, iter_num, due).add_done_callback(finish_submitted)
+"""
+    elif adaptive_concurrency:
+        runner_block = """
+def run_requests(expanded_requests):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for req, iter_num in expanded_requests:
+            concurrency_limit.acquire()
+            submit_slots.acquire()
+            future = executor.submit(req, iter_num)
+            future.add_done_callback(lambda _: concurrency_limit.release())
+            future.add_done_callback(finish_submitted)
+    print(f"Adaptive concurrency settled at {concurrency_limit.limit:.1f} in-flight requests")
+"""
+    else:
+        runner_block = """
+def run_requests(expanded_requests):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for req, iter_num in expanded_requests:
+            submit_slots.acquire()
+            executor.submit(req, iter_num).add_done_callback(finish_submitted)
+"""
+    run_call = "asyncio.run(run_requests(expanded_requests))" if engine == "async" else \
+        "run_requests(expanded_requests)"
+    setup_calls = []
+    cleanup_calls = []
+    if background_saves:
+        cleanup_calls.append("close_saver()")
+    if metrics_file:
+        setup_calls.append("start_metrics(total)")
+        cleanup_calls.append("stop_metrics()")
+    batch_lines = [
+        "for work in batches:",
+        "    expanded_requests = ((requests_list[req_idx], iter_num) for req_idx, iter_num in work)",
+        f"    {run_call}",
+    ]
+    if cleanup_calls:
+        run_lines = setup_calls + ["try:"] + [f"    {line}" for line in batch_lines] + ["finally:"] + \
+            [f"    {call}" for call in cleanup_calls]
+    else:
+        run_lines = batch_lines
+    run_block = "\n    ".join(run_lines)
+    shard_lines = ["global rate_share", "rate_share = 1.0 / processes"]
+    if metrics_file:
+        shard_lines = ["global rate_share, metrics_shard", "rate_share = 1.0 / processes", "metrics_shard = shard_idx"]
+    shard_globals = "\n    ".join(shard_lines)
+
+    results_file = f"{os.path.splitext(report_filename)[0]}.{results_format}" if results_format else ""
+    script_lines.append(f"""
+total_runs = {total_runs}
+threads = {threads}
+processes = {processes}
+report_filename = {json.dumps(report_filename)}
+results_format = {results_format!r}
+results_file = {json.dumps(results_file)}
+results_batch_size = {int(results_batch_size)}
+render_excel = {bool(render_excel)}
+result_columns = {[name for name, _ in result_fields]}
+result_types = {[kind for _, kind in result_fields]}
+target_rps = {float(target_rps)}
+rate_profile = {json.dumps(rate_profile)}
+profile_seconds = {float(profile_seconds)}
+rate_share = 1.0
+schedule_started = None
+QUEUED_PER_THREAD = 2
+RATE_STEPS = 4
+RAMP_FLOOR = 0.01
+SPIKE_FACTOR = 5
+SPIKE_FRACTION = 0.1
+""")
+    script_lines.append(HISTOGRAM_BLOCK)
+    if metrics_file or distributed:
+        script_lines.append(PROGRESS_BLOCK)
+    if metrics_file:
+        script_lines.append(f"metrics_file = {json.dumps(metrics_file)}")
+        script_lines.append(f"metrics_interval = {float(metrics_interval)}")
+        script_lines.append(METRICS_BLOCK)
+    if adaptive_concurrency:
+        script_lines.append("""
+AIMD_INITIAL = 4
+AIMD_INCREASE = 1.0
+AIMD_DECREASE = 0.5
+AIMD_LATENCY_FACTOR = 2.0
+AIMD_SMOOTHING = 0.2
+AIMD_BASELINE_SMOOTHING = 0.02""")
+        script_lines.append(AIMD_BLOCK)
+        if metrics_file:
+            script_lines.append('metrics_gauges["concurrency"] = lambda: concurrency_limit.limit')
+    if load_mode == "open":
+        script_lines.append(RATE_PROFILE_BLOCK)
+    script_lines.append(WORK_PLAN_BLOCK)
+    if engine == "threads":
+        script_lines.append(THREAD_SUBMIT_BLOCK)
+    script_lines.append(runner_block)
+    if results_format:
+        script_lines.append(RESULTS_SINK_BLOCK)
+        script_lines.append("""
+def shard_results_path(shard_idx):
+    stem, ext = os.path.splitext(results_file)
+    return f"{stem}.part{shard_idx}{ext}"
+
+
+def begin_shard(shard_idx):
+    global results_path
+    results_path = shard_results_path(shard_idx)
+    # A shard that records no rows never opens its part; a stale one must not be merged.
+    if os.path.exists(results_path):
+        os.remove(results_path)
 
-    df = pd.DataFrame(results)
-    df.to_excel(report_filename, index=False)
+
+def finish_shard():
+    close_results()
+    return results_path
+
+
+def collect_shards(outputs):
+    merge_result_parts(outputs)
+
+
+def finish_run():
+    close_results()
+    if render_excel:
+        render_report()
+    print_latency_summary()
+    print(f"Results saved to {results_file}")
+""")
+    else:
+        script_lines.append("""
+def record_result(row):
+    results.append(row)
+
+
+def begin_shard(shard_idx):
+    pass
+
+
+def finish_shard():
+    return [[row.get(column) for column in result_columns] for row in results]
+
+
+def collect_shards(outputs):
+    for rows in outputs:
+        results.extend(dict(zip(result_columns, row)) for row in rows)
+
+
+def finish_run():
+    with pd.ExcelWriter(report_filename) as writer:
+        pd.DataFrame(results, columns=result_columns).to_excel(writer, sheet_name="results", index=False)
+        pd.DataFrame(latency_summary()).to_excel(writer, sheet_name="latency", index=False)
+    print_latency_summary()
+""")
+    script_lines.append(f"""
+def run_batches(batches, total):
+    # Batches run one after another; a distributed worker passes its leases here.
+    {run_block}
+
+
+def run_work(work):
+    run_batches([work], len(work))
+
+
+def run_shard(shard_idx, shard):
+    # Runs in a worker process; each shard offers its share of the target
+    # rate and sends its results and latency histograms back to the parent.
+    {shard_globals}
+    begin_shard(shard_idx)
+    try:
+        run_work(shard)
+    finally:
+        output = finish_shard()
+    return output, histogram_snapshot()
+""")
+
+    cli_arguments = []
+    worker_block = ""
+    process_branch = "if processes > 1:"
+    begin_lines = ""
+    end_lines = ""
+    if distributed:
+        fingerprint_files = "[os.path.abspath(__file__)]"
+        if script_layout == "table" and spec_storage == "sidecar":
+            fingerprint_files = "[os.path.abspath(__file__), specs_path]"
+        script_lines.append(f"""
+fingerprint_files = {fingerprint_files}
+lease_size = {int(lease_size)}
+report_interval = {float(report_interval)}""")
+        script_lines.append(DISTRIBUTED_BLOCK)
+        cli_arguments += [
+            '"--coordinator", metavar="HOST:PORT", help="hand the work out to workers from this address"',
+            '"--workers", type=int, default=1, help="workers to wait for before starting"',
+            '"--spawn-local", type=int, default=0, metavar="N", help="start N workers on this machine"',
+            '"--worker", metavar="URL", help="run leases from the coordinator at this URL"',
+        ]
+        worker_block = """
+    if args.worker:
+        run_worker(args.worker, work)
+        sys.exit()"""
+        process_branch = """if args.coordinator:
+            run_coordinator(args.coordinator, args.workers, args.spawn_local, work)
+        elif processes > 1:"""
+    if cassette:
+        script_lines.append(CASSETTE_BLOCK)
+        cli_arguments += [
+            '"--record", metavar="CASSETTE", help="save the responses of this run to a cassette file"',
+            '"--replay", metavar="CASSETTE", help="answer every request from a cassette instead of the network"',
+            '"--profile", choices=["cprofile", "pyinstrument"], help="profile the runner while it sends"',
+        ]
+        begin_lines = "\n    begin_diagnostics(args.record, args.replay, args.profile)"
+        end_lines = "\n        end_diagnostics()"
+        if distributed:
+            worker_block = """
+    if args.replay:
+        worker_arguments.extend(["--replay", os.path.abspath(args.replay)])
+    if args.worker:
+        try:
+            run_worker(args.worker, work)
+        finally:
+            end_diagnostics()
+        sys.exit()"""
+        # Recording, replaying and profiling measure one process.
+        process_branch = process_branch.replace("processes > 1", "processes > 1 and not diagnostics_active()")
+    cli_block = ""
+    if cli_arguments:
+        cli_block = "\n    parser = argparse.ArgumentParser(description=\"Run the generated load test.\")" + \
+            "".join(f"\n    parser.add_argument({argument})" for argument in cli_arguments) + \
+            "\n    args = parser.parse_args()"
+        script_lines.insert(0, "import argparse")
+
+    main_block = f"""
+
+if __name__ == "__main__":
+    work = WorkPlan(len(requests_list))
+{cli_block}{begin_lines}{worker_block}
+
+    try:
+        {process_branch}
+            shards = [work[p::processes] for p in range(processes)]
+            outputs = []
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                for output, snapshot in pool.map(run_shard, range(processes), shards):
+                    outputs.append(output)
+                    merge_histograms(snapshot)
+            collect_shards(outputs)
+        else:
+            run_work(work)
+    finally:{end_lines}
+        finish_run()
     print("All requests completed.")
 """
     script_lines.append(textwrap.dedent(main_block))
@@ -331,4 +3036,10 @@ if __name__ == "__main__":
     print(f"\n✅ Generated script: {output_file}")
 
 
-
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] != "-":
+        with open(sys.argv[1], "rb") as f:
+            process_extracted_curls(f)
+    else:
+        process_extracted_curls(sys.stdin)
@@ -0,0 +1,329 @@
+import json
+import re
+import sys
+import urllib.parse
+
+from extract_curl import read_text_chunks, write_extraction_store
+
+
+HAR_READ_CHUNK_SIZE = 1 << 20
+
+JSON_WS_RE = re.compile(r"[ \t\r\n]*")
+JSON_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+JSON_SCALAR_RE = re.compile(r"[^,}\]\s]*")
+# Non-bracket text and whole strings; a string cut off by the chunk end is left to skip_string().
+JSON_STRUCTURE_RE = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+SKIPPED_HEADERS = {"content-length", "cookie"}
+# Request members the record is built from; the rest are skipped undecoded.
+HAR_REQUEST_KEYS = {"url", "method", "headers", "cookies", "postData"}
+
+
+class JsonStream:
+    # Minimal pull scanner over a chunked JSON document. Values can be skipped
+    # without being decoded, so large response bodies are never materialized.
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = ""
+        self.pos = 0
+        self.mark = None
+        self.marked = []
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return False
+        if self.mark is not None:
+            # A marked value can span many chunks; its pieces are joined once in take_marked().
+            self.marked.append(self.buf[self.mark:self.pos])
+            self.mark = 0
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def take_marked(self):
+        self.marked.append(self.buf[self.mark:self.pos])
+        text = "".join(self.marked)
+        self.marked = []
+        self.mark = None
+        return text
+
+    def peek(self):
+        while True:
+            match = JSON_WS_RE.match(self.buf, self.pos)
+            self.pos = match.end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of HAR document")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at HAR offset {self.pos}, found {self.buf[self.pos]!r}")
+        self.pos += 1
+
+    def skip_string(self):
+        self.expect('"')
+        while True:
+            match = JSON_STRING_BODY_RE.match(self.buf, self.pos)
+            end = match.end()
+            if end < len(self.buf) and self.buf[end] == '"':
+                self.pos = end + 1
+                return
+            # Stops before a trailing backslash, which is re-read with the next chunk.
+            self.pos = end
+            if not self.fill():
+                raise ValueError("Unterminated string in HAR document")
+
+    def read_string(self):
+        self.peek()
+        self.mark = self.pos
+        self.skip_string()
+        return json.loads(self.take_marked())
+
+    def skip_value(self):
+        char = self.peek()
+        if char == '"':
+            self.skip_string()
+            return
+        if char not in "{[":
+            # Scalars end at the next separator or closing bracket.
+            while True:
+                match = JSON_SCALAR_RE.match(self.buf, self.pos)
+                self.pos = match.end()
+                if self.pos < len(self.buf) or not self.fill():
+                    return
+        depth = 0
+        while True:
+            match = JSON_STRUCTURE_RE.match(self.buf, self.pos)
+            self.pos = match.end()
+            if self.pos >= len(self.buf):
+                if not self.fill():
+                    raise ValueError("Unexpected end of HAR document")
+                continue
+            char = self.buf[self.pos]
+            if char == '"':
+                self.skip_string()
+                continue
+            self.pos += 1
+            depth += 1 if char in "{[" else -1
+            if depth == 0:
+                return
+
+    def read_raw(self):
+        # Returns the undecoded JSON text of the next value.
+        self.peek()
+        self.mark = self.pos
+        self.skip_value()
+        return self.take_marked()
+
+    def read_value(self):
+        return json.loads(self.read_raw())
+
+    def iter_keys(self):
+        # Yields each member name of an object; the caller consumes the value.
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' at HAR offset {self.pos - 1}")
+
+    def iter_items(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' at HAR offset {self.pos - 1}")
+
+
+def domain_matches(host, domains):
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def har_request_record(request):
+    parsed_url = urllib.parse.urlparse(request.get("url", ""))
+    headers = {}
+    cookies = {}
+    for header in request.get("headers", []):
+        name = header.get("name", "")
+        if name.startswith(":"):
+            continue
+        if name.lower() == "cookie":
+            for cookie in header.get("value", "").split(";"):
+                if "=" in cookie:
+                    c_key, c_val = cookie.strip().split("=", 1)
+                    cookies.setdefault(c_key, c_val)
+        elif name.lower() not in SKIPPED_HEADERS:
+            headers[name] = header.get("value", "")
+    for cookie in request.get("cookies", []):
+        cookies[cookie["name"]] = cookie.get("value", "")
+
+    body_params = {}
+    json_data = {}
+    form_data = {}
+    post_data = request.get("postData") or {}
+    mime_type = post_data.get("mimeType", "")
+    if post_data and not any(name.lower() == "content-type" for name in headers) and mime_type:
+        headers["Content-Type"] = mime_type
+    if mime_type.startswith("multipart/"):
+        # The captured boundary no longer matches once the form is re-encoded.
+        headers = {name: value for name, value in headers.items() if name.lower() != "content-type"}
+    if post_data.get("params"):
+        target = form_data if mime_type.startswith("multipart/") else body_params
+        for param in post_data["params"]:
+            target[param["name"]] = param.get("value", "")
+    elif post_data.get("text"):
+        text = post_data["text"]
+        try:
+            parsed = json.loads(text)
+            if "application/json" in mime_type and isinstance(parsed, (dict, list)):
+                json_data = parsed
+            else:
+                body_params.update(urllib.parse.parse_qsl(text))
+        except json.JSONDecodeError:
+            body_params.update(urllib.parse.parse_qsl(text))
+
+    return {
+        "url": f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}",
+        "method": request.get("method", "GET").upper(),
+        "headers": headers,
+        "cookies": cookies,
+        "query_params": dict(urllib.parse.parse_qsl(parsed_url.query)),
+        "body_params": body_params,
+        "json_data": json_data,
+        "form_data": form_data
+    }
+
+
+def request_rejected(request, domains, methods):
+    # Judges whichever of url and method have been read so far.
+    if "url" in request:
+        parsed_url = urllib.parse.urlparse(request["url"])
+        if parsed_url.scheme not in ("http", "https"):
+            return True
+        if domains and not domain_matches(parsed_url.hostname or "", domains):
+            return True
+    return bool(methods) and "method" in request and request["method"].upper() not in methods
+
+
+def read_request(stream, domains, methods):
+    # Reads entry.request member by member. url and method are decoded as soon
+    # as they appear; once they rule the entry out, everything after them is
+    # skipped. Other kept members stay raw JSON until the entry is accepted.
+    request = {}
+    raw = {}
+    rejected = False
+    for key in stream.iter_keys():
+        if rejected or key not in HAR_REQUEST_KEYS:
+            stream.skip_value()
+        elif key in ("url", "method"):
+            request[key] = stream.read_value()
+            rejected = request_rejected(request, domains, methods)
+        else:
+            raw[key] = stream.read_raw()
+    request.setdefault("url", "")
+    request.setdefault("method", "GET")
+    if rejected or request_rejected(request, domains, methods):
+        return None
+    return request, raw
+
+
+def read_entry(stream, domains, methods, mime_types):
+    # Decodes only what entry.request needs and entry.response.content.mimeType;
+    # every other member, and all members after a filter rejects the entry, is
+    # skipped. The record is only built for entries that pass every filter.
+    request = None
+    rejected = False
+    mime_type = ""
+    for key in stream.iter_keys():
+        if rejected:
+            stream.skip_value()
+        elif key == "request":
+            request = read_request(stream, domains, methods)
+            rejected = request is None
+        elif key == "response" and mime_types:
+            for response_key in stream.iter_keys():
+                if response_key != "content":
+                    stream.skip_value()
+                    continue
+                for content_key in stream.iter_keys():
+                    if content_key == "mimeType":
+                        mime_type = stream.read_string().lower()
+                    else:
+                        stream.skip_value()
+            rejected = not any(mime_type.startswith(prefix) for prefix in mime_types)
+        else:
+            stream.skip_value()
+    if rejected or request is None:
+        return None
+    if mime_types and not any(mime_type.startswith(prefix) for prefix in mime_types):
+        return None
+    request, raw = request
+    request.update((key, json.loads(value)) for key, value in raw.items())
+    return har_request_record(request)
+
+
+def iter_har_records(source, domains=None, methods=None, mime_types=None, chunk_size=HAR_READ_CHUNK_SIZE):
+    domains = {domain.strip().lower() for domain in domains or [] if domain.strip()}
+    methods = {method.strip().upper() for method in methods or [] if method.strip()}
+    mime_types = [mime.strip().lower() for mime in mime_types or [] if mime.strip()]
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from iter_har_records(f, domains, methods, mime_types, chunk_size)
+        return
+
+    stream = JsonStream(read_text_chunks(source, chunk_size))
+    if stream.peek() == "\ufeff":
+        stream.pos += 1
+    for key in stream.iter_keys():
+        if key != "log":
+            stream.skip_value()
+            continue
+        for log_key in stream.iter_keys():
+            if log_key != "entries":
+                stream.skip_value()
+                continue
+            for _ in stream.iter_items():
+                record = read_entry(stream, domains, methods, mime_types)
+                if record is not None:
+                    yield record
+
+
+def import_har(source, extracted_data_dir="extracted_data", domains=None, methods=None, mime_types=None):
+    index = write_extraction_store(iter_har_records(source, domains, methods, mime_types), extracted_data_dir)
+    print(f"✅ Imported {len(index['meta'])} HAR entries into {extracted_data_dir}.")
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import a HAR capture into the extraction store.")
+    parser.add_argument("har_file", help="HAR file to import, or - for stdin")
+    parser.add_argument("--out", default="extracted_data", help="extraction store directory")
+    parser.add_argument("--domain", action="append", default=[], help="keep only this domain (repeatable)")
+    parser.add_argument("--method", action="append", default=[], help="keep only this method (repeatable)")
+    parser.add_argument("--mime", action="append", default=[], help="keep only this response MIME prefix (repeatable)")
+    args = parser.parse_args()
+    import_har(sys.stdin.buffer if args.har_file == "-" else args.har_file, args.out,
+               args.domain, args.method, args.mime)